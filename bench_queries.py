@@ -0,0 +1,60 @@
+from os import environ
+from time import process_time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database_setup import Base, Topic, Editor, Section
+from queries import allTopics, latestSections, topicById, topicSections
+from queries import sectionById, editorEmail
+
+# Microbenchmark of the Baked Queries
+#   Run the queries of the viewSection route, as built per request before and
+# as baked in queries.py, against the app's database, initialized by
+# initSubjectNotesDB.py. Report the Python CPU time of the process per
+# request. Time spent by the database server is in another process and is not
+# counted, thus, the difference is the CPU time saved per request.
+#   Run it by: python bench_queries.py
+
+if environ.get('DATABASE_URL') is None:
+    engine = create_engine('postgresql:///deeplearning')
+else:
+    engine = create_engine(environ.get('DATABASE_URL'))
+
+Base.metadata.bind = engine
+DBSession = sessionmaker(bind=engine)
+
+nRequests = 2000
+topic_id = 1
+section_id = 11
+
+
+def builtPerRequest(session):
+    session.query(Topic).all()
+    session.query(Section, Topic.title).\
+        filter(Section.topic_id == Topic.id).\
+        order_by(Section.utce.desc())[0:5]
+    topic = session.query(Topic).filter_by(id=topic_id).one()
+    session.query(Section).filter_by(topic_id=topic.id).\
+        order_by(Section.id).all()
+    section = session.query(Section).filter_by(id=section_id).one()
+    session.query(Editor.email).filter_by(id=section.editor_id).one()
+
+
+def baked(session):
+    allTopics(session)
+    latestSections(session)
+    topic = topicById(session, topic_id)
+    topicSections(session, topic.id)
+    section = sectionById(session, section_id)
+    editorEmail(session, section.editor_id)
+
+
+for name, queries in [('built per request', builtPerRequest),
+                      ('baked', baked)]:
+    queries(DBSession())  # warm up
+    start = process_time()
+    for index in range(nRequests):
+        session = DBSession()
+        queries(session)
+        session.close()
+    perRequest = 1e6 * (process_time() - start) / nRequests
+    print('{:20} {:8.1f} us of CPU per request'.format(name, perRequest))
@@ -1,6 +1,8 @@
 from datetime import datetime
 from os import environ
 from sqlalchemy import Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import Boolean, LargeBinary, Text, UniqueConstraint
+from sqlalchemy import Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy import create_engine
@@ -59,6 +61,13 @@ def maxSectionsPerTopic():
     return 10
 
 
+# Number of characters of notes per note chunk
+#   Notes are stored in chunks, so that a range of notes can be retrieved by
+# fetching and decompressing only the chunks that hold it.
+def noteChunkSize():
+    return 16384
+
+
 # Default value for edit Coordinated Universal Time (UTC)
 #   When initalized, a section's edit UTC equals its initial UTC. SQLAlchemy
 # requires this kind of method to set the default value of one column to that
@@ -76,6 +85,9 @@ def utceDefault(context):
 # * The initiator_id is the id of the editor who started the section.
 # * utci is the UTC time when the initiator started the Section.
 # * The editor_id is the id of the editor who last edited the section.
+# * A section's notes are stored in note chunks, not in the section table, so
+#     that queries of sections never load notes. notes_size is the number of
+#     characters of the notes. See note_chunks.py.
 # * utce is the UTC time when the editor last edited the Section.
 # * The datetime objects assigned to utci and utce do not contain timezone
 #     information. Since the function employed to generate them, utcnow,
@@ -84,7 +96,7 @@ class Section(Base):
     __tablename__ = 'section'
     id = Column(Integer, primary_key=True)
     title = Column(String(50), nullable=False)
-    notes = Column(String(800))
+    notes_size = Column(Integer, default=0, nullable=False)
     utci = Column(DateTime, default=datetime.utcnow, nullable=False)
     utce = Column(DateTime, default=utceDefault)
     topic_id = Column(Integer, ForeignKey('topic.id'), nullable=False)
@@ -93,17 +105,136 @@ class Section(Base):
     topic = relationship(Topic)
     editor = relationship(Editor)
 
+
+# Serialization keys of Section fields, in order
+#   Each key is that of a field's value in a serialized section. The JSON API
+# endpoints can serialize a subset of the fields of a section, thus, keys are
+# defined per field. Each field other than 'notes' is a Section column.
+def sectionSerialKeys():
+    return {'id': 'k1 id',
+            'title': 'k2 section',
+            'notes': 'k3 notes',
+            'topic_id': 'k4 topic id',
+            'editor_id': 'k5 editor id',
+            'notes_size': 'k6 notes size'}
+
+
+# Chunk of a Section's notes
+# * A section's notes are split into chunks of noteChunkSize() characters.
+#     Each chunk is stored zlib compressed.
+# * number counts the chunks of a section from 0.
+# * A section's chunks follow it when its id is re-sequenced and are deleted
+#     with it.
+class NoteChunk(Base):
+    __tablename__ = 'note_chunk'
+    section_id = Column(
+        Integer, ForeignKey('section.id', onupdate='CASCADE',
+                            ondelete='CASCADE'), primary_key=True)
+    number = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
+
+# Revision of a Section
+# * Every addition or edit of a section appends a revision of it. Revisions are
+#     never updated. A section's stored notes remain its latest notes.
+# * number counts the revisions of a section from 1.
+# * If snapshot is True, the revision's full notes are stored in revision
+#     chunks, and data is None. Otherwise, data holds a delta against the notes
+#     of the previous revision, zlib compressed. See revisions.py.
+# * base_number is the number of the snapshot revision that this revision's
+#     chain of deltas starts from.
+# * size is the number of characters of the revision's notes.
+# * A section's revisions follow it when its id is re-sequenced and are deleted
+#     with it.
+class Revision(Base):
+    __tablename__ = 'revision'
+    __table_args__ = (UniqueConstraint('section_id', 'number'),)
+    id = Column(Integer, primary_key=True)
+    section_id = Column(
+        Integer, ForeignKey('section.id', onupdate='CASCADE',
+                            ondelete='CASCADE'), nullable=False)
+    number = Column(Integer, nullable=False)
+    base_number = Column(Integer, nullable=False)
+    snapshot = Column(Boolean, nullable=False)
+    title = Column(String(50), nullable=False)
+    data = Column(LargeBinary)
+    size = Column(Integer, nullable=False)
+    utc = Column(DateTime, default=datetime.utcnow, nullable=False)
+    editor_id = Column(Integer, ForeignKey('editor.id'), nullable=False)
+
     @property
     def serialize(self):
         return {
-            'k1 id': self.id,
+            'k1 revision': self.number,
             'k2 section': self.title,
-            'k3 notes': self.notes,
-            'k4 topic id': self.topic_id,
-            'k5 editor id': self.editor_id
+            'k3 size': self.size,
+            'k4 editor id': self.editor_id,
+            'k5 utc': self.utc.isoformat()
         }
 
 
+# Chunk of a Snapshot Revision's notes
+# * A snapshot's notes are split into chunks of noteChunkSize() characters, as
+#     a section's notes are. Each chunk is stored zlib compressed.
+# * number counts the chunks of a revision from 0.
+# * A revision's chunks are deleted with it.
+class RevisionChunk(Base):
+    __tablename__ = 'revision_chunk'
+    revision_id = Column(
+        Integer, ForeignKey('revision.id', ondelete='CASCADE'),
+        primary_key=True)
+    number = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
+
+# Draft of a Section
+# * A draft holds a contributor's unsubmitted title and notes of a new section
+#     of a topic, or of an edit of a section. section_id is None for a new
+#     section. A contributor is identified by email, since a contributor
+#     becomes an editor only when adding a first section.
+# * Drafts are autosaved by the section forms. When a form is submitted, its
+#     draft's title and notes are cleared and submitted_utc is set, as a
+#     tombstone. Autosaves from a form opened before then are refused. See
+#     drafts.py.
+# * utc is the UTC time when the draft was autosaved.
+# * opened_utc is the UTC time when the draft's form was opened.
+# * There is one draft per contributor and section, or new section of a topic.
+#     Since NULLs are distinct in a unique constraint, drafts of new sections
+#     are made unique by a partial index.
+class Draft(Base):
+    __tablename__ = 'draft'
+    __table_args__ = (
+        UniqueConstraint('email', 'topic_id', 'section_id'),
+        Index('draft_new_section_key', 'email', 'topic_id', unique=True,
+              postgresql_where=text('section_id IS NULL')))
+    id = Column(Integer, primary_key=True)
+    email = Column(String(50), nullable=False)
+    topic_id = Column(Integer, ForeignKey('topic.id'), nullable=False)
+    section_id = Column(
+        Integer, ForeignKey('section.id', onupdate='CASCADE',
+                            ondelete='CASCADE'))
+    title = Column(String(50))
+    notes = Column(Text)
+    utc = Column(DateTime, nullable=False)
+    opened_utc = Column(DateTime, nullable=False)
+    submitted_utc = Column(DateTime)
+
+
+# Renumbering of the Sections of a Topic
+# * When a section is deleted, the sections of its topic with greater ids are
+#     re-sequenced, each to the id below. section_id is the id of the deleted
+#     section, thus, every section id from it on may now name another section.
+# * utc is the UTC time when the re-sequencing was complete. Draft autosaves of
+#     the affected sections from forms opened before then are refused. See
+#     drafts.py.
+class Renumbering(Base):
+    __tablename__ = 'renumbering'
+    id = Column(Integer, primary_key=True)
+    topic_id = Column(Integer, ForeignKey('topic.id'), nullable=False)
+    section_id = Column(Integer, nullable=False)
+    utc = Column(DateTime, nullable=False)
+
+
 if environ.get('DATABASE_URL') is None:
     engine = create_engine('postgresql:///deeplearning')
 else:
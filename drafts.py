@@ -0,0 +1,193 @@
+from atexit import register
+from datetime import datetime
+from threading import Thread, Lock
+from time import sleep
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from database_setup import Draft, Renumbering
+
+# Draft Autosave
+#   The section forms autosave drafts while a contributor types. Autosaves are
+# buffered in memory per contributor and section, and a newer autosave of the
+# same draft replaces the buffered one. A background thread writes the buffered
+# drafts to the draft table every draftFlushInterval() seconds, in one
+# transaction. Thus, the number of database writes grows with the number of
+# contributors typing, not with the number of autosaves. A draft is identified
+# by a key: a triple of the contributor's email, topic id and section id, the
+# latter being None for a new section.
+#   Autosaves of a draft may be buffered by several processes, e.g. gunicorn
+# workers, and may still be in flight when its form is submitted. Thus,
+# submitting a form does not delete its draft but marks it submitted, as a
+# tombstone, and an autosave is only written or restored if its form was opened
+# after the draft was last submitted. Likewise, as deleting a section
+# re-sequences the ids of the sections after it, an autosave of a section is
+# only written or restored if its form was opened after the last renumbering of
+# that section's id.
+
+
+# Seconds between writes of buffered drafts to the database
+def draftFlushInterval():
+    return 10
+
+
+# Format of the time a form was opened, as carried by its autosaves
+def draftTimeFormat():
+    return '%Y-%m-%dT%H:%M:%S.%f'
+
+
+# Return a Boolean that indicates whether a draft of a form opened at opened
+# is live, given the time its stored draft was last submitted, if any.
+def draftLive(opened, submitted):
+    return submitted is None or opened > submitted
+
+
+# Return a Boolean that indicates whether the id of a section of a topic was
+# renumbered since a time, e.g. that of the opening of a draft's form. Drafts
+# of new sections, with a section id of None, are not affected.
+def renumberedSince(session, topic_id, section_id, utc):
+    if section_id is None:
+        return False
+    return session.query(Renumbering.id).filter(
+        Renumbering.topic_id == topic_id,
+        Renumbering.section_id <= section_id,
+        Renumbering.utc >= utc).first() is not None
+
+
+class DraftBuffer:
+    def __init__(self, sessionClass):
+        self.sessionClass = sessionClass
+        self.lock = Lock()
+        self.drafts = {}
+        self.thread = None
+
+    # Buffer an autosave of a draft from a form opened at opened. The flushing
+    # thread is started on the first autosave, i.e. after a forking server has
+    # forked.
+    def save(self, key, title, notes, opened):
+        with self.lock:
+            self.drafts[key] = (title, notes, datetime.utcnow(), opened)
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+                # Write drafts still buffered when the process exits.
+                register(self.flush)
+
+    # Return a draft as a double: (title, notes), or None if there is none.
+    # Of the buffered and the stored draft, the latest live one is returned.
+    def get(self, session, key):
+        email, topic_id, section_id = key
+        draft = session.query(Draft).filter_by(
+            email=email, topic_id=topic_id, section_id=section_id).first()
+        with self.lock:
+            buffered = self.drafts.get(key)
+        submitted = draft.submitted_utc if draft is not None else None
+        stored = None
+        if draft is not None and draftLive(draft.opened_utc, submitted):
+            stored = draft
+        if buffered is not None and draftLive(buffered[3], submitted) and \
+                (stored is None or stored.utc < buffered[2]) and \
+                not renumberedSince(
+                    session, topic_id, section_id, buffered[3]):
+            return buffered[:2]
+        if stored is not None:
+            return stored.title, stored.notes
+        return None
+
+    # Discard a draft, as its form was submitted, by marking it submitted.
+    # This is committed in a session of its own, after the form's changes. If
+    # a flush inserts the draft concurrently, the mark is retried once.
+    def discard(self, key):
+        with self.lock:
+            self.drafts.pop(key, None)
+        try:
+            self.markSubmitted(key)
+        except IntegrityError:
+            self.markSubmitted(key)
+
+    def markSubmitted(self, key):
+        email, topic_id, section_id = key
+        now = datetime.utcnow()
+        session = self.sessionClass()
+        try:
+            draft = session.query(Draft).filter_by(
+                email=email, topic_id=topic_id,
+                section_id=section_id).first()
+            if draft is None:
+                draft = Draft(email=email, topic_id=topic_id,
+                              section_id=section_id, opened_utc=now)
+                session.add(draft)
+            draft.title = None
+            draft.notes = None
+            draft.utc = now
+            draft.submitted_utc = now
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    # Record the renumbering of the sections of a topic from the id of a
+    # deleted section on, and drop the buffered drafts of those sections. The
+    # record is committed with the caller's session, once the sections are
+    # re-sequenced.
+    def renumber(self, session, topic_id, section_id):
+        with self.lock:
+            for key in [key for key in self.drafts if key[1] == topic_id and
+                        key[2] is not None and key[2] >= section_id]:
+                del self.drafts[key]
+        session.add(Renumbering(topic_id=topic_id, section_id=section_id,
+                                utc=datetime.utcnow()))
+
+    def run(self):
+        while True:
+            sleep(draftFlushInterval())
+            self.flush()
+
+    # Write the buffered drafts to the database in one transaction. If that
+    # fails, write them one by one, so that an invalid draft, e.g. of a deleted
+    # section, does not hold back the others. A draft that cannot be written
+    # is dropped.
+    def flush(self):
+        with self.lock:
+            drafts, self.drafts = self.drafts, {}
+        if not drafts:
+            return
+        try:
+            self.write(drafts.items())
+        except SQLAlchemyError:
+            for item in drafts.items():
+                try:
+                    self.write([item])
+                except SQLAlchemyError:
+                    pass
+
+    # Write drafts, given as (key, (title, notes, utc, opened)) doubles, in
+    # one transaction. A stored draft is only replaced by a newer one, and a
+    # submitted draft only by one from a form opened after its submission. A
+    # draft of a section renumbered since its form was opened is dropped.
+    def write(self, drafts):
+        session = self.sessionClass()
+        try:
+            for (email, topic_id, section_id), (title, notes, utc, opened) \
+                    in drafts:
+                if renumberedSince(session, topic_id, section_id, opened):
+                    continue
+                draft = session.query(Draft).filter_by(
+                    email=email, topic_id=topic_id,
+                    section_id=section_id).first()
+                if draft is None:
+                    session.add(Draft(
+                        email=email, topic_id=topic_id, section_id=section_id,
+                        title=title, notes=notes, utc=utc, opened_utc=opened))
+                elif draftLive(opened, draft.submitted_utc) and \
+                        draft.utc < utc:
+                    draft.title = title
+                    draft.notes = notes
+                    draft.utc = utc
+                    draft.opened_utc = opened
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            session.close()
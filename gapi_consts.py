@@ -19,7 +19,48 @@ def gajFileName():
     return 'gaj.dat'
 
 
-if environ.get(gajEVName()) is None:
+# Retrieve OAuth stub environment variable name.
+#   When this variable holds the base URL of a stand-in OAuth 2 provider, such
+# as the one served by oauth_stub.py, sign in and sign out are made against it
+# instead of Google. This enables load testing authenticated routes offline.
+def gapiStubEVName():
+    return 'OAUTH_STUB_URL'
+
+
+# Retrieve OAuth stub base URL, or None if Google is employed.
+def gapiStubURL():
+    return environ.get(gapiStubEVName())
+
+
+# Retrieve load test environment variable name.
+#   The stand-in provider signs in whoever its caller claims to be. Thus, with
+# a production database, i.e. when DATABASE_URL is set, it is only employed if
+# this variable is also set to '1', e.g. for load testing a staging copy.
+def loadTestEVName():
+    return 'OAUTH_STUB_LOAD_TEST'
+
+
+if gapiStubURL() is not None and environ.get('DATABASE_URL') is not None \
+        and environ.get(loadTestEVName()) != '1':
+    print("\nException: \n" +
+          "\"{}\" is set along with \"DATABASE_URL\".".format(
+              gapiStubEVName()) +
+          " Set \"{}\" to 1 to employ the OAuth stub".format(
+              loadTestEVName()) +
+          " with that database.\n")
+    raise SystemExit(1)
+elif gapiStubURL() is not None:
+    # Describe the stand-in provider in the form of a GAJ. Its redirect URI
+    # is that of the app under test, for both local and deployed use.
+    redirectURI = environ.get('OAUTH_STUB_REDIRECT_URI',
+                              'http://localhost:8000/oauth2callback')
+    GAJdict = {'web': {
+        'client_id': 'stub-client-id',
+        'client_secret': 'stub-client-secret',
+        'auth_uri': gapiStubURL() + '/auth',
+        'token_uri': gapiStubURL() + '/token',
+        'redirect_uris': [redirectURI, redirectURI]}}
+elif environ.get(gajEVName()) is None:
     try:
         with open(gajFileName(), 'r') as inFile:
             GAJdict = load(inFile)
@@ -55,3 +96,15 @@ def gapiScopes():
 # Google Oauth2 API specs
 def gapiOauth():
     return {'name': 'oauth2', 'version': 'v2'}
+
+
+# Google Oauth2 API userinfo endpoint, employed directly only with the stub
+def gapiUserinfoURI():
+    return gapiStubURL() + '/userinfo'
+
+
+# Google OAuth 2 token revocation endpoint
+def gapiRevokeURI():
+    if gapiStubURL() is not None:
+        return gapiStubURL() + '/revoke'
+    return 'https://accounts.google.com/o/oauth2/revoke'
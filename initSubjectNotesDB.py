@@ -3,6 +3,7 @@ from datetime import datetime
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from database_setup import Base, Topic, Editor, Section
+from note_chunks import writeNotes
 
 
 if environ.get('DATABASE_URL') is None:
@@ -67,46 +68,46 @@ session.commit()
 # human readability of the code. The resulting newlines and indent spaces are
 # removed by employing the split() and join() methods.
 section = session.query(Section).filter_by(id=10).one()
-section.notes = ' '.join('''
+writeNotes(session, section, ' '.join('''
     There are four salient trends in the history of the study of deep learning.
     Deep learning has been variously labelled in its relatively short history.
     The size of data sets analyzed by deep learning has increased with the
     march of this history. Simultaneously, deep learning mathematical model
     sizes have continued to increase. Logically, the accuracy of analyses with
-    deep learning have continued to improve.'''.split())
+    deep learning have continued to improve.'''.split()))
 section.utce = datetime.utcnow()
 session.commit()
 
 section = session.query(Section).filter_by(id=11).one()
-section.notes = ' '.join('''
+writeNotes(session, section, ' '.join('''
     What we now know as deep learning was introduced as cybernetics circa 1940.
     It began being called connectionism or neural networks circa 1980. The rise
-    of the current name began circa 2006.'''.split())
+    of the current name began circa 2006.'''.split()))
 section.utce = datetime.utcnow()
 session.commit()
 
 section = session.query(Section).filter_by(id=12).one()
-section.notes = ' '.join('''
+writeNotes(session, section, ' '.join('''
     Increases in computer memory have resulted in commensurate increases in
     digital data. Larger data sets have enabled deep learning algorithms to be
-    applied to increasingly complex applications.'''.split())
+    applied to increasingly complex applications.'''.split()))
 section.utce = datetime.utcnow()
 session.commit()
 
 section = session.query(Section).filter_by(id=13).one()
-section.notes = ' '.join('''
+writeNotes(session, section, ' '.join('''
     Increases in computer performance have enabled commensurate increases in
     deep learning model sizes. Specifically, the number of neurons of an
     artificial neural network has doubled about every 2.5 years since their
     inception.  Additionally, the number of connections per model neuron has
-    risen.'''.split())
+    risen.'''.split()))
 section.utce = datetime.utcnow()
 session.commit()
 
 section = session.query(Section).filter_by(id=14).one()
-section.notes = ' '.join('''
+writeNotes(session, section, ' '.join('''
     Image recognition error rate steadily dropped annually from 28% in 2010 to
-    4% in 2015.'''.split())
+    4% in 2015.'''.split()))
 section.utce = datetime.utcnow()
 session.commit()
 
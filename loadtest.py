@@ -0,0 +1,233 @@
+from argparse import ArgumentParser
+from random import Random
+from re import findall, sub
+from threading import Thread, Lock
+from time import perf_counter
+from requests import Session
+from requests.exceptions import RequestException
+
+# Load Test of the App
+#   Simulate concurrent visitor and contributor sessions against a running app
+# and report throughput, latency percentiles and error rate per route. A
+# visitor browses the contents, topics, sections and about views. A
+# contributor signs in through the stand-in OAuth 2 provider of oauth_stub.py,
+# browses, adds a section, edits it, deletes it and signs out. Contributors
+# are numbered in order before the users start, and work on topics assigned
+# round-robin by that order. Thus, two contributors share a topic, and
+# concurrent section id re-sequencing of it is exercised, only when there are
+# more contributors than topics.
+#   Example run, with a database initialized by initSubjectNotesDB.py:
+#     python oauth_stub.py --port 8001 &
+#     OAUTH_STUB_URL=http://127.0.0.1:8001 \
+#       OAUTH_STUB_REDIRECT_URI=http://127.0.0.1:8000/oauth2callback \
+#       gunicorn --preload -w 4 -b 127.0.0.1:8000 subjectNotes:app &
+#     python loadtest.py --url http://127.0.0.1:8000 --users 20 --duration 60
+# The --preload option is required with several workers, since the app's
+# secret key, which signs the session cookie, is generated at import. The app
+# refuses the stand-in provider when DATABASE_URL is set, unless
+# OAUTH_STUB_LOAD_TEST is set to 1, since the stub signs anyone in as anyone.
+
+
+# Return the route of a URL path, with its integer parts as placeholders.
+def routeOf(path):
+    return sub(r'/\d+', '/<int>', path)
+
+
+# Return the value of a percentile of sorted latencies, by nearest rank.
+def percentile(sortedLatencies, fraction):
+    index = max(0, int(round(fraction * len(sortedLatencies))) - 1)
+    return sortedLatencies[index]
+
+
+# Latencies and errors of app requests, per route
+class Recorder:
+    def __init__(self):
+        self.lock = Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route, latency, error):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(latency)
+            self.errors[route] = self.errors.get(route, 0) + int(error)
+
+    def report(self, duration):
+        header = '{:40} {:>7} {:>8} {:>8} {:>8} {:>8} {:>8} {:>7}'
+        row = '{:40} {:>7} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} ' + \
+            '{:>6.1f}%'
+        print(header.format('route', 'count', 'req/s', 'p50 ms', 'p90 ms',
+                            'p99 ms', 'max ms', 'errors'))
+        total = 0
+        totalErrors = 0
+        for route in sorted(self.latencies):
+            latencies = sorted(self.latencies[route])
+            total += len(latencies)
+            totalErrors += self.errors[route]
+            print(row.format(
+                route, len(latencies), len(latencies) / duration,
+                1000 * percentile(latencies, 0.5),
+                1000 * percentile(latencies, 0.9),
+                1000 * percentile(latencies, 0.99), 1000 * latencies[-1],
+                100 * self.errors[route] / len(latencies)))
+        if total:
+            print('{:40} {:>7} {:>8.1f} {:>53.1f}%'.format(
+                'all', total, total / duration, 100 * totalErrors / total))
+
+
+# A simulated user, visitor or contributor, with its own cookie session
+class User:
+    def __init__(self, url, recorder, rng, number):
+        self.url = url.rstrip('/')
+        self.recorder = recorder
+        self.rng = rng
+        self.number = number
+        self.http = Session()
+
+    # Request a URL of the app without following redirects and record it. A
+    # server error or a failed connection counts as an error. Return the
+    # response, or None on failure.
+    def fetch(self, method, url, **kwargs):
+        if url.startswith('/'):
+            url = self.url + url
+        route = routeOf(url[len(self.url):].split('?')[0])
+        start = perf_counter()
+        try:
+            response = self.http.request(
+                method, url, allow_redirects=False, timeout=30, **kwargs)
+        except RequestException:
+            self.recorder.record(route, perf_counter() - start, True)
+            return None
+        self.recorder.record(
+            route, perf_counter() - start, response.status_code >= 500)
+        return response
+
+    # Browse from the contents view to a topic and some of its sections.
+    # Return the id of the topic browsed, or None on failure.
+    def browse(self, topic_id=None):
+        response = self.fetch('GET', '/topics')
+        if response is None or response.status_code != 200:
+            return None
+        if topic_id is None:
+            topic_ids = sorted(set(findall(r'/topics/(\d+)"', response.text)))
+            if not topic_ids:
+                return None
+            topic_id = self.rng.choice(topic_ids)
+        response = self.fetch('GET', '/topics/{}'.format(topic_id))
+        if response is None or response.status_code != 200:
+            return None
+        section_ids = findall(r'/topics/{}/(\d+)"'.format(topic_id),
+                              response.text)
+        for section_id in self.rng.sample(
+                section_ids, min(2, len(section_ids))):
+            self.fetch('GET', '/topics/{}/{}'.format(topic_id, section_id))
+        if self.rng.random() < 0.1:
+            self.fetch('GET', '/about')
+        return topic_id
+
+    # Sign in through the stand-in provider as user<number>@example.com.
+    def signIn(self):
+        self.fetch('GET', '/signindesk')
+        response = self.fetch('GET', '/authenticate')
+        if response is None or 'Location' not in response.headers:
+            return False
+        # The provider is not part of the app. Its requests are not recorded.
+        try:
+            response = self.http.get(
+                response.headers['Location'] + '&login_hint=user{}@example.com'
+                .format(self.number), allow_redirects=False, timeout=30)
+        except RequestException:
+            return False
+        if 'Location' not in response.headers:
+            return False
+        response = self.fetch('GET', response.headers['Location'])
+        return response is not None and response.status_code == 302
+
+    # Add a section to a topic, edit it and delete it.
+    def contribute(self, topic_id):
+        response = self.fetch('GET', '/topics/{}/new'.format(topic_id))
+        if response is None or response.status_code != 200:
+            # The topic has the maximum number of sections.
+            return
+        response = self.fetch(
+            'POST', '/topics/{}/new'.format(topic_id),
+            data={'title': 'Load {}'.format(self.number),
+                  'notes': 'Notes added under load.'})
+        if response is None or 'Location' not in response.headers:
+            return
+        section_ids = findall(r'/topics/{}/(\d+)$'.format(topic_id),
+                              response.headers['Location'])
+        if not section_ids:
+            return
+        sectionPath = '/topics/{}/{}'.format(topic_id, section_ids[0])
+        self.fetch('GET', sectionPath)
+        self.fetch('GET', sectionPath + '/edit')
+        self.fetch('POST', sectionPath + '/edit',
+                   data={'title': '', 'notes': 'Notes edited under load.'})
+        self.fetch('GET', sectionPath + '/JSON')
+        self.fetch('GET', sectionPath + '/delete')
+        self.fetch('POST', sectionPath + '/delete')
+
+    def visit(self):
+        self.browse()
+
+    def contributorVisit(self, topic_id):
+        if self.signIn():
+            self.browse(topic_id)
+            self.contribute(topic_id)
+            self.fetch('GET', '/topics/{}/JSON'.format(topic_id))
+            self.fetch('GET', '/signout')
+        self.http.close()
+        self.http = Session()
+
+
+# Return the topic ids of the contributors among users numbered from 0, as a
+# dictionary by user number. Users are chosen as contributors at random, and
+# contributors are assigned topics round-robin in the order of their choice.
+def contributorTopics(seed, nUsers, contributorFraction, nTopics):
+    rng = Random(seed)
+    topicIds = {}
+    for number in range(nUsers):
+        if rng.random() < contributorFraction:
+            topicIds[number] = len(topicIds) % nTopics + 1
+    return topicIds
+
+
+# Run a simulated user until the deadline. The user is a contributor to the
+# topic of topic_id, or a visitor if topic_id is None.
+def simulate(url, recorder, seed, number, topic_id, deadline):
+    rng = Random(seed + number)
+    user = User(url, recorder, rng, number)
+    while perf_counter() < deadline:
+        if topic_id is not None:
+            user.contributorVisit(topic_id)
+        else:
+            user.visit()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Load test the app.')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, default=10,
+                        help='number of concurrent simulated users')
+    parser.add_argument('--contributors', type=float, default=0.2,
+                        help='fraction of users that are contributors')
+    parser.add_argument('--topics', type=int, default=5,
+                        help='number of topics in the database')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to run')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    start = perf_counter()
+    deadline = start + args.duration
+    topicIds = contributorTopics(
+        args.seed, args.users, args.contributors, args.topics)
+    threads = [Thread(target=simulate, args=(
+        args.url, recorder, args.seed, number, topicIds.get(number),
+        deadline)) for number in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorder.report(perf_counter() - start)
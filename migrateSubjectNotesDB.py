@@ -0,0 +1,121 @@
+from os import environ
+from sqlalchemy import create_engine, inspect, text
+from zlib import decompress
+from sqlalchemy.orm import sessionmaker
+from database_setup import Base, Section, RevisionChunk
+from note_chunks import writeNotes, iterChunkRows
+
+# Migration of the Subject Notes Database
+#   Bring a database created by an earlier version of the app to the current
+# schema, keeping its contents. database_setup.py creates missing tables on
+# import; the steps below alter existing ones. Each step first checks whether
+# it is needed, thus, running this script again is harmless. Heroku runs it in
+# the release phase of every deploy, before new web dynos start. See Procfile.
+#   Run it by: python migrateSubjectNotesDB.py
+
+
+if environ.get('DATABASE_URL') is None:
+    engine = create_engine('postgresql:///deeplearning')
+else:
+    engine = create_engine(environ.get('DATABASE_URL'))
+
+Base.metadata.bind = engine
+DBSession = sessionmaker(bind=engine)
+
+
+# Return the names of the columns of a table.
+def columnNames(tableName):
+    return {column['name']
+            for column in inspect(engine).get_columns(tableName)}
+
+
+# Move section notes from the notes column of the section table to note
+# chunks. See note_chunks.py.
+#   notes_size is added first, so that sections load as Section instances.
+# Then, the notes of each section are read and written by writeNotes, one
+# section at a time. The notes column is dropped last.
+def migrateNotesToChunks(session):
+    if 'notes' not in columnNames('section'):
+        return
+    session.execute(text('ALTER TABLE section ADD COLUMN IF NOT EXISTS '
+                         'notes_size INTEGER NOT NULL DEFAULT 0'))
+    section_ids = [row.id for row in
+                   session.execute(text('SELECT id FROM section ORDER BY id'))]
+    for section_id in section_ids:
+        notes = session.execute(
+            text('SELECT notes FROM section WHERE id = :section_id'),
+            {'section_id': section_id}).scalar()
+        section = session.query(Section).filter_by(id=section_id).one()
+        writeNotes(session, section, notes)
+        session.flush()
+    session.execute(text('ALTER TABLE section DROP COLUMN notes'))
+    print('Moved the notes of {} sections to note chunks.'.
+          format(len(section_ids)))
+
+
+# Add the tombstone columns and the uniqueness of drafts to the draft table.
+# See drafts.py. Of duplicate drafts, only the latest autosaved is kept. Each
+# kept draft is taken to be from a form opened when it was autosaved.
+def migrateDraftTombstones(session):
+    if 'submitted_utc' in columnNames('draft'):
+        return
+    session.execute(text(
+        'DELETE FROM draft AS older USING draft AS newer '
+        'WHERE older.email = newer.email '
+        'AND older.topic_id = newer.topic_id '
+        'AND older.section_id IS NOT DISTINCT FROM newer.section_id '
+        'AND (older.utc, older.id) < (newer.utc, newer.id)'))
+    session.execute(text('ALTER TABLE draft ADD COLUMN opened_utc TIMESTAMP'))
+    session.execute(text('UPDATE draft SET opened_utc = utc'))
+    session.execute(text(
+        'ALTER TABLE draft ALTER COLUMN opened_utc SET NOT NULL'))
+    session.execute(text(
+        'ALTER TABLE draft ADD COLUMN submitted_utc TIMESTAMP'))
+    session.execute(text(
+        'ALTER TABLE draft ADD UNIQUE (email, topic_id, section_id)'))
+    session.execute(text(
+        'CREATE UNIQUE INDEX draft_new_section_key ON draft (email, topic_id) '
+        'WHERE section_id IS NULL'))
+    print('Added tombstones to drafts.')
+
+
+# Move the notes of snapshot revisions from the data column of the revision
+# table to revision chunks. See revisions.py. data is made nullable first, as
+# snapshots keep none. Then, the snapshots are moved one at a time.
+def migrateSnapshotsToChunks(session):
+    columns = {column['name']: column
+               for column in inspect(engine).get_columns('revision')}
+    if columns['data']['nullable']:
+        return
+    session.execute(
+        text('ALTER TABLE revision ALTER COLUMN data DROP NOT NULL'))
+    revision_ids = [row.id for row in session.execute(
+        text('SELECT id FROM revision WHERE snapshot ORDER BY id'))]
+    for revision_id in revision_ids:
+        data = session.execute(
+            text('SELECT data FROM revision WHERE id = :revision_id'),
+            {'revision_id': revision_id}).scalar()
+        session.add_all(iterChunkRows(
+            RevisionChunk, {'revision_id': revision_id},
+            [decompress(data).decode()]))
+        session.execute(
+            text('UPDATE revision SET data = NULL WHERE id = :revision_id'),
+            {'revision_id': revision_id})
+        session.flush()
+    print('Moved {} revision snapshots to revision chunks.'.
+          format(len(revision_ids)))
+
+
+# The steps share one transaction, thus, a failed migration leaves the database
+# as it was. PostgreSQL alters tables transactionally.
+session = DBSession()
+try:
+    migrateNotesToChunks(session)
+    migrateDraftTombstones(session)
+    migrateSnapshotsToChunks(session)
+    session.commit()
+except Exception:
+    session.rollback()
+    raise
+finally:
+    session.close()
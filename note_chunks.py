@@ -0,0 +1,100 @@
+from zlib import compress, decompress
+from database_setup import NoteChunk, noteChunkSize
+
+# Storage of Section Notes
+#   A section's notes are stored in chunks of noteChunkSize() characters, each
+# zlib compressed, in the note_chunk table. Snapshot revisions of notes are
+# chunked alike, in the revision_chunk table. See revisions.py. Offsets into
+# notes are counted in characters. Reading a range of notes fetches only the
+# chunks holding it, a few at a time, thus, the memory a read takes is bounded
+# regardless of the size of the notes.
+
+
+# Number of chunks fetched per query when reading notes
+def chunksPerFetch():
+    return 4
+
+
+# Generate the chunks of text given as an iterable of string parts, e.g. the
+# chunks of stored notes, as instances of a chunk class, e.g. NoteChunk. owner
+# is a dictionary of the chunks' owner column, e.g. {'section_id': 11}. The
+# parts are cut into chunks of noteChunkSize() characters as they come, thus,
+# at most one chunk of text is carried from one part to the next.
+def iterChunkRows(chunkClass, owner, parts):
+    size = noteChunkSize()
+    number = 0
+    text = ''
+    for part in parts:
+        text += part
+        start = 0
+        while len(text) - start >= size:
+            data = compress(text[start:start + size].encode())
+            yield chunkClass(number=number, data=data, **owner)
+            number += 1
+            start += size
+        text = text[start:]
+    if text:
+        yield chunkClass(number=number, data=compress(text.encode()), **owner)
+
+
+# Replace the notes of a section. Notes of only whitespace are stored as no
+# notes. The section must have been flushed to the database.
+def writeNotes(session, section, notes):
+    session.query(NoteChunk).filter_by(section_id=section.id).\
+        delete(synchronize_session=False)
+    if notes is None or notes.isspace():
+        notes = ''
+    section.notes_size = len(notes)
+    session.add_all(
+        iterChunkRows(NoteChunk, {'section_id': section.id}, [notes]))
+
+
+# Yield the notes of a section from character start up to character stop, or
+# to the end if stop is None, chunk by chunk.
+def iterNotes(session, section_id, start=0, stop=None):
+    size = noteChunkSize()
+    number = start // size
+    while stop is None or number * size < stop:
+        chunks = session.query(NoteChunk.number, NoteChunk.data).\
+            filter(NoteChunk.section_id == section_id,
+                   NoteChunk.number >= number).\
+            order_by(NoteChunk.number).limit(chunksPerFetch()).all()
+        for chunk in chunks:
+            if stop is not None and chunk.number * size >= stop:
+                return
+            text = decompress(chunk.data).decode()
+            offset = chunk.number * size
+            yield text[max(start - offset, 0):
+                       None if stop is None else stop - offset]
+        if len(chunks) < chunksPerFetch():
+            return
+        number = chunks[-1].number + 1
+
+
+# Return the notes of a section from character start up to character stop, or
+# to the end if stop is None.
+def readNotes(session, section_id, start=0, stop=None):
+    return ''.join(iterNotes(session, section_id, start, stop))
+
+
+# Return the notes of several sections from character start up to character
+# stop, as a dictionary by section id. The chunks holding the range are fetched
+# for all sections in one query. Sections without notes in the range are
+# omitted.
+def readNotesByIds(session, section_ids, start, stop):
+    if not section_ids or stop <= start:
+        return {}
+    size = noteChunkSize()
+    chunks = session.query(
+        NoteChunk.section_id, NoteChunk.number, NoteChunk.data).\
+        filter(NoteChunk.section_id.in_(section_ids),
+               NoteChunk.number >= start // size,
+               NoteChunk.number <= (stop - 1) // size).\
+        order_by(NoteChunk.section_id, NoteChunk.number).all()
+    notesById = {}
+    for chunk in chunks:
+        offset = chunk.number * size
+        text = decompress(chunk.data).decode()
+        notesById[chunk.section_id] = notesById.get(chunk.section_id, '') + \
+            text[max(start - offset, 0):stop - offset]
+    return notesById
@@ -0,0 +1,122 @@
+from argparse import ArgumentParser
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from secrets import token_urlsafe
+from threading import Lock
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+# Stand-in OAuth 2 Provider
+#   This server imitates the parts of Google's OAuth 2 provider that the app
+# employs: the authorization, token, userinfo and revoke endpoints. It grants
+# every authorization request without user interaction, so that authenticated
+# routes can be exercised offline, e.g. by loadtest.py. Run the app against it
+# by setting OAUTH_STUB_URL to this server's base URL. The signed-in user's
+# email is taken from the login_hint parameter of the authorization request.
+#   Run it by: python oauth_stub.py --port 8001
+
+
+# Default email of a signed-in user, when no login_hint is given
+def defaultEmail():
+    return 'stub.user@example.com'
+
+
+# Grants issued so far. codes maps an authorization code to its email and
+# scope. tokens maps an access token to its email.
+codes = {}
+tokens = {}
+grantsLock = Lock()
+
+
+# Return the userinfo of an email in the form returned by Google's Oauth2 API.
+def userinfo(email):
+    name = email.split('@')[0]
+    return {'id': sha256(email.encode()).hexdigest()[:21],
+            'email': email,
+            'verified_email': True,
+            'name': name,
+            'given_name': name,
+            'family_name': '',
+            'picture': ''}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        payload = dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def form(self):
+        length = int(self.headers.get('Content-Length', 0))
+        fields = parse_qs(self.rfile.read(length).decode())
+        fields.update(parse_qs(urlsplit(self.path).query))
+        return {key: values[0] for key, values in fields.items()}
+
+    # Authorization endpoint: grant the request and redirect back to the app.
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/auth':
+            code = token_urlsafe(16)
+            with grantsLock:
+                codes[code] = (query.get('login_hint', defaultEmail()),
+                               query.get('scope', ''))
+            location = query['redirect_uri'] + '?' + urlencode(
+                {'code': code, 'state': query.get('state', ''),
+                 'scope': query.get('scope', '')})
+            self.send_response(302)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif url.path == '/userinfo':
+            token = self.headers.get('Authorization', '')[len('Bearer '):]
+            with grantsLock:
+                email = tokens.get(token)
+            if email is None:
+                self.send_json(401, {'error': 'invalid_token'})
+            else:
+                self.send_json(200, userinfo(email))
+        else:
+            self.send_json(404, {'error': 'not_found'})
+
+    # Token and revoke endpoints
+    def do_POST(self):
+        url = urlsplit(self.path)
+        fields = self.form()
+        if url.path == '/token':
+            with grantsLock:
+                grant = codes.pop(fields.get('code'), None)
+                if grant is not None:
+                    token = token_urlsafe(24)
+                    tokens[token] = grant[0]
+            if grant is None:
+                self.send_json(400, {'error': 'invalid_grant'})
+            else:
+                self.send_json(200, {'access_token': token,
+                                     'token_type': 'Bearer',
+                                     'expires_in': 3600,
+                                     'refresh_token': token_urlsafe(24),
+                                     'scope': grant[1]})
+        elif url.path == '/revoke':
+            with grantsLock:
+                tokens.pop(fields.get('token'), None)
+            self.send_json(200, {})
+        else:
+            self.send_json(404, {'error': 'not_found'})
+
+    # Keep the console quiet under load.
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serve a stand-in OAuth 2 provider.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print('OAuth stub serving on http://{}:{}'.format(args.host, args.port))
+    server.serve_forever()
@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from os import environ, makedirs, remove, replace, listdir, rmdir
+from os.path import join, isfile, isdir, dirname
+from tempfile import NamedTemporaryFile
+from sqlalchemy import text
+
+# Pre-rendered Public Views
+#   The public views contents, topicContents and viewSection are the same for
+# every visitor. When the environment variable named by prerenderEVName()
+# holds a directory path, these views are rendered to static HTML files within
+# that directory. Each page is stored at
+# <directory><url path>/index.html, so that a front proxy can serve it
+# directly, e.g. with nginx's "try_files $uri/index.html @app". The app serves
+# the same files to visitors itself. Contributors always get live renders.
+
+
+# Retrieve pre-render directory environment variable name.
+def prerenderEVName():
+    return 'PRERENDER_DIR'
+
+
+# Retrieve pre-render directory, or None if pre-rendering is disabled.
+def prerenderDir():
+    return environ.get(prerenderEVName())
+
+
+# Retrieve page file name of a pre-rendered view.
+def pageFileName():
+    return 'index.html'
+
+
+# Return the file path of the pre-rendered page of a URL path, such as
+# '/topics/1'.
+def pagePath(urlPath):
+    return join(prerenderDir(), urlPath.strip('/'), pageFileName())
+
+
+# Return the file path of the pre-rendered page of a URL path if that page
+# exists. Otherwise, return None.
+def existingPagePath(urlPath):
+    if prerenderDir() is None:
+        return None
+    path = pagePath(urlPath)
+    if isfile(path):
+        return path
+    return None
+
+
+# Key of the Postgres advisory lock that serializes page regenerations
+def pageLockKey():
+    return 26
+
+
+# Serialize page regenerations across the app's processes, e.g. gunicorn
+# workers, by holding a transaction-level advisory lock on a connection of
+# engine.
+#   A regeneration must read the database only once it holds the lock. Then,
+# the last page written reflects every change committed before it was
+# rendered, and an older render never replaces a newer page.
+@contextmanager
+def pageLock(engine):
+    with engine.begin() as connection:
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                           {'key': pageLockKey()})
+        yield
+
+
+# Write the pre-rendered page of a URL path, given as an iterable of string
+# parts.
+#   The page is first written to a temporary file in the same directory, then
+# moved into place. The move is atomic, thus, a reader never observes a
+# partially written page.
+def writePage(urlPath, parts):
+    path = pagePath(urlPath)
+    makedirs(dirname(path), exist_ok=True)
+    with NamedTemporaryFile('w', encoding='utf-8', dir=dirname(path),
+                            suffix='.tmp', delete=False) as outFile:
+        try:
+            for part in parts:
+                outFile.write(part)
+        except Exception:
+            remove(outFile.name)
+            raise
+    replace(outFile.name, path)
+
+
+# Remove the pre-rendered page of a URL path, and its directory if that is
+# left empty.
+def removePage(urlPath):
+    path = pagePath(urlPath)
+    if isfile(path):
+        remove(path)
+    if isdir(dirname(path)) and not listdir(dirname(path)):
+        rmdir(dirname(path))
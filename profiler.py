@@ -0,0 +1,208 @@
+from os import environ, makedirs, listdir, remove
+from os.path import join, basename
+from sys import _current_frames
+from threading import Thread, Lock, Event, get_ident
+from time import sleep, time
+from random import random
+from hmac import compare_digest
+
+# On-demand Sampling Profiler
+#   A profiled request's thread is sampled by a background thread at a fixed
+# interval. Each sample is the request thread's stack, prefixed by the route
+# and the phase the request was in: 'db', 'template', 'oauth' or 'app'. The
+# phase is that of the innermost stack frame belonging to SQLAlchemy or
+# psycopg2, Jinja2, or an OAuth or HTTP client library, respectively. Thus,
+# unprofiled requests carry no instrumentation. A profile is written in the
+# collapsed-stack format read by flamegraph.pl, speedscope and similar tools,
+# to a directory that keeps only the most recent profiles.
+#   A request is profiled when its profile header equals the secret held by the
+# environment variable named by profileTokenEVName(), or at random for the
+# fraction of requests held by the one named by profileRateEVName().
+
+
+# Retrieve profile token environment variable name.
+def profileTokenEVName():
+    return 'PROFILE_TOKEN'
+
+
+# Retrieve profile rate environment variable name.
+def profileRateEVName():
+    return 'PROFILE_RATE'
+
+
+# Retrieve name of the request header that asks for a profile.
+def profileHeaderName():
+    return 'X-Profile'
+
+
+# Retrieve directory of recent profiles.
+def profileDir():
+    return environ.get('PROFILE_DIR', 'profiles')
+
+
+# Max number of profiles kept in the profile directory, read once. A malformed
+# value is ignored, and at least one profile is kept.
+try:
+    maxProfilesValue = max(int(environ.get('PROFILE_RING', 50)), 1)
+except ValueError:
+    print('\nIgnoring malformed PROFILE_RING: "{}".\n'.format(
+        environ.get('PROFILE_RING')))
+    maxProfilesValue = 50
+
+
+# Retrieve max number of profiles kept in the profile directory.
+def maxProfiles():
+    return maxProfilesValue
+
+
+# Seconds between samples
+def sampleInterval():
+    return 0.005
+
+
+# Phases by library path component, looked up from the innermost stack frame
+# outward
+def phasesByPath():
+    return [('sqlalchemy', 'db'), ('psycopg2', 'db'), ('jinja2', 'template'),
+            ('oauthlib', 'oauth'), ('googleapiclient', 'oauth'),
+            ('google/auth', 'oauth'), ('requests', 'oauth'),
+            ('urllib3', 'oauth'), ('httplib2', 'oauth')]
+
+
+# Fraction of requests profiled at random, read once. A malformed value
+# disables random profiling rather than failing every request.
+try:
+    profileRateValue = float(environ.get(profileRateEVName(), 0))
+except ValueError:
+    print('\nIgnoring malformed {}: "{}".\n'.format(
+        profileRateEVName(), environ.get(profileRateEVName())))
+    profileRateValue = 0.0
+
+
+# Retrieve fraction of requests profiled at random.
+def profileRate():
+    return profileRateValue
+
+
+# Return a Boolean that indicates whether a request is to be profiled, given
+# the value of its profile header. The values are compared as UTF-8 bytes,
+# since compare_digest rejects strings of non-ASCII characters.
+def profileRequested(headerValue):
+    token = environ.get(profileTokenEVName())
+    if token and headerValue and \
+            compare_digest(headerValue.encode(), token.encode()):
+        return True
+    return profileRate() > 0 and random() < profileRate()
+
+
+# Return the collapsed-stack label of a frame: function (file:first line).
+def frameLabel(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(
+        code.co_name, basename(code.co_filename), code.co_firstlineno)
+
+
+# Return the phase of a stack, given its frames from innermost outward.
+def phaseOf(frames):
+    for frame in frames:
+        fileName = frame.f_code.co_filename.replace('\\', '/')
+        for path, phase in phasesByPath():
+            if '/' + path + '/' in fileName:
+                return phase
+    return 'app'
+
+
+# Profile of one request
+class Profile:
+    def __init__(self, route):
+        self.route = route
+        self.thread_id = get_ident()
+        self.start = time()
+        self.counts = {}
+
+    # Record a sample of the request thread's stack. It is called from the
+    # sampler thread only.
+    def sample(self, frame):
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        stack = [self.route, phaseOf(frames)] + \
+            [frameLabel(frame) for frame in reversed(frames)]
+        key = ';'.join(label.replace(';', ':') for label in stack)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    # Write the profile to the profile directory and remove the oldest
+    # profiles beyond maxProfiles().
+    def write(self):
+        if not self.counts:
+            return
+        makedirs(profileDir(), exist_ok=True)
+        fileName = '{:.6f}-{}-{}.folded'.format(
+            self.start, self.route, int(1000 * (time() - self.start)))
+        with open(join(profileDir(), fileName), 'w') as outFile:
+            for stack, count in sorted(self.counts.items()):
+                outFile.write('{} {}\n'.format(stack, count))
+        profiles = sorted(name for name in listdir(profileDir())
+                          if name.endswith('.folded'))
+        for name in profiles[:-maxProfiles()]:
+            try:
+                remove(join(profileDir(), name))
+            except FileNotFoundError:
+                pass  # Already removed by another worker process.
+
+
+# Sampler of the threads of profiled requests
+#   One sampler thread serves all profiled requests of a process. It is started
+# on the first profiled request, i.e. after a forking server has forked, and it
+# waits idle while no request is profiled.
+class Sampler:
+    def __init__(self):
+        self.lock = Lock()
+        self.profiles = {}
+        self.active = Event()
+        self.thread = None
+
+    def add(self, profile):
+        with self.lock:
+            self.profiles[profile.thread_id] = profile
+            self.active.set()
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def discard(self, profile):
+        with self.lock:
+            self.profiles.pop(profile.thread_id, None)
+            if not self.profiles:
+                self.active.clear()
+
+    def run(self):
+        while True:
+            self.active.wait()
+            sleep(sampleInterval())
+            frames = _current_frames()
+            # Sample under the lock, so that a profile is not written while
+            # it is being sampled.
+            with self.lock:
+                for profile in self.profiles.values():
+                    frame = frames.get(profile.thread_id)
+                    if frame is not None:
+                        profile.sample(frame)
+            del frames
+
+
+sampler = Sampler()
+
+
+# Begin profiling the current request thread. Return its profile.
+def startProfile(route):
+    profile = Profile(route)
+    sampler.add(profile)
+    return profile
+
+
+# End profiling of a request and write its profile.
+def finishProfile(profile):
+    sampler.discard(profile)
+    profile.write()
@@ -0,0 +1,67 @@
+from sqlalchemy import bindparam
+from sqlalchemy.ext import baked
+from database_setup import Topic, Editor, Section
+
+# Baked Queries of the Hot Routes
+#   The public views and JSON endpoints run the same few queries on every
+# request. Building a Query object and compiling it to SQL costs more Python
+# CPU time than fetching these few rows. Each query below is built and compiled
+# once per process, then cached by SQLAlchemy's bakery and run with bound
+# parameters. A query's cache key is the code location of its lambdas, thus,
+# each query is defined once, here.
+
+bakery = baked.bakery()
+
+
+# Return all topics.
+def allTopics(session):
+    return bakery(lambda s: s.query(Topic))(session).all()
+
+
+# Return the latest 5 added or updated sections, each with its topic title.
+def latestSections(session):
+    return bakery(lambda s: s.query(Section, Topic.title).
+                  filter(Section.topic_id == Topic.id).
+                  order_by(Section.utce.desc()).limit(5))(session).all()
+
+
+# Return a topic by id.
+def topicById(session, topic_id):
+    return bakery(lambda s: s.query(Topic).
+                  filter(Topic.id == bindparam('topic_id')))(session).\
+        params(topic_id=topic_id).one()
+
+
+# Return the sections of a topic, ordered by id.
+def topicSections(session, topic_id):
+    return bakery(lambda s: s.query(Section).
+                  filter(Section.topic_id == bindparam('topic_id')).
+                  order_by(Section.id))(session).\
+        params(topic_id=topic_id).all()
+
+
+# Return a section by id.
+def sectionById(session, section_id):
+    return bakery(lambda s: s.query(Section).
+                  filter(Section.id == bindparam('section_id')))(session).\
+        params(section_id=section_id).one()
+
+
+# Return the email of an editor by id.
+def editorEmail(session, editor_id):
+    return bakery(lambda s: s.query(Editor.email).
+                  filter(Editor.id == bindparam('editor_id')))(session).\
+        params(editor_id=editor_id).one().email
+
+
+# Return the given columns of the sections of the given ids, ordered by id.
+#   The columns vary by request, thus, this query is not baked.
+def sectionColumnsByIds(session, section_ids, columns):
+    return session.query(*columns).filter(Section.id.in_(section_ids)).\
+        order_by(Section.id).all()
+
+
+# Return the given columns of the sections of a topic, ordered by id.
+def topicSectionColumns(session, topic_id, columns):
+    return session.query(*columns).filter(Section.topic_id == topic_id).\
+        order_by(Section.id).all()
@@ -0,0 +1,459 @@
+from bisect import bisect_right
+from datetime import datetime
+from difflib import SequenceMatcher
+from hashlib import blake2b
+from json import dumps, loads
+from re import split
+from zlib import compress, decompress
+from sqlalchemy.orm import defer
+from database_setup import Revision, RevisionChunk, noteChunkSize
+from note_chunks import iterNotes, iterChunkRows, chunksPerFetch
+
+# Section Revision History
+#   A section's revisions are stored in an append-only log. A revision's notes
+# are stored as a compressed delta against the previous revision's notes, so
+# that storage grows with the size of an edit rather than that of the notes.
+# Every snapshotInterval() revisions, or when a delta would insert most of the
+# notes, the full notes are stored instead, as a snapshot. Thus, reconstructing
+# any revision applies at most snapshotInterval() - 1 deltas to a snapshot.
+#   A delta is a JSON list whose items are either a pair [start, end], copying
+# that slice of the previous notes, or a string, inserted as is. Notes are
+# matched piece by piece, a piece being a line or a sentence, cut into slices
+# of at most maxPieceSize() characters. Pieces are delimited by their content,
+# thus, an edit only changes the pieces it touches. A new delta copies each
+# run of pieces of the new notes found in the previous notes and inserts the
+# others. The previous notes are read chunk by chunk and only the digests of
+# their pieces are kept, thus, computing a delta takes time linear in the size
+# of the notes and never holds the previous notes in memory whole.
+#   A snapshot's notes are stored in chunks, as a section's notes are. A range
+# of a revision's notes is reconstructed by following the copies of the deltas
+# of its chain that overlap the range down to the snapshot, and reading only
+# the snapshot chunks they reach. Thus, reading a page of a revision's notes,
+# or the parts of a revision shown in its diff, takes memory that grows with
+# the page and the deltas, not with the notes.
+
+
+# Max number of revisions from a snapshot to the next snapshot
+def snapshotInterval():
+    return 10
+
+
+# Max number of characters of a piece of notes matched at once
+def maxPieceSize():
+    return 1024
+
+
+# Min number of characters copied by an item of a delta. Shorter matches, e.g.
+# of blank lines, are inserted instead.
+def minCopySize():
+    return 32
+
+
+# Max number of characters of a change that is diffed word by word
+def maxWordDiffSize():
+    return 4096
+
+
+# Number of characters of unchanged notes shown on each side of a change
+def diffContextSize():
+    return 300
+
+
+# Max number of characters of changes shown in a diff
+def maxDiffSize():
+    return 65536
+
+
+# Generate the pieces of notes given as an iterable of string parts, e.g. the
+# chunks of stored notes. A piece ends with a newline, or with a sentence's
+# closing punctuation and the space after it. A longer piece is cut into
+# slices of maxPieceSize() characters from its start. The pieces do not depend
+# on how the notes are split into parts.
+def notePieces(parts):
+    size = maxPieceSize()
+    carry = ''
+    for part in parts:
+        pieces = split(r'(?<=\n)|(?<=[.!?] )', carry + part)
+        carry = pieces.pop()
+        for piece in pieces:
+            for index in range(0, len(piece), size):
+                yield piece[index:index + size]
+        # The last character is kept, for a boundary after it.
+        while len(carry) > size:
+            yield carry[:size]
+            carry = carry[size:]
+    for index in range(0, len(carry), size):
+        yield carry[index:index + size]
+
+
+# Return the digest of a piece of notes.
+def pieceDigest(piece):
+    return blake2b(piece.encode(), digest_size=16).digest()
+
+
+# Return the runs of new notes matched against old notes, both given as
+# iterables of string parts, as a list of triples: [[start, newStart, size],
+# ..., [...]]. A run copies size characters from old character start to new
+# character newStart, or is inserted if start is None. A piece of the new
+# notes is matched where the previous run ended if it matches there, else at
+# its first match in the old notes.
+def matchRuns(oldParts, newParts):
+    firstOffsets = {}
+    digestsByOffset = {}
+    offset = 0
+    for piece in notePieces(oldParts):
+        digest = pieceDigest(piece)
+        firstOffsets.setdefault(digest, offset)
+        digestsByOffset[offset] = digest
+        offset += len(piece)
+    runs = []
+    position = 0
+    for piece in notePieces(newParts):
+        digest = pieceDigest(piece)
+        last = runs[-1] if runs else None
+        if last is not None and last[0] is not None and \
+                digestsByOffset.get(last[0] + last[2]) == digest:
+            last[2] += len(piece)
+        elif digest in firstOffsets:
+            runs.append([firstOffsets[digest], position, len(piece)])
+        elif last is not None and last[0] is None:
+            last[2] += len(piece)
+        else:
+            runs.append([None, position, len(piece)])
+        position += len(piece)
+    return runs
+
+
+# Return a delta of new notes against old notes, given as an iterable of
+# string parts, and the number of characters it inserts as a double: (delta,
+# inserted). Runs shorter than minCopySize() are inserted.
+def notesDelta(oldParts, notes):
+    delta = []
+    inserted = 0
+    insertStart = None
+    for start, newStart, size in matchRuns(oldParts, [notes]):
+        if start is None or size < minCopySize():
+            if insertStart is None:
+                insertStart = newStart
+            continue
+        if insertStart is not None:
+            delta.append(notes[insertStart:newStart])
+            inserted += newStart - insertStart
+            insertStart = None
+        delta.append([start, start + size])
+    if insertStart is not None:
+        delta.append(notes[insertStart:])
+        inserted += len(notes) - insertStart
+    return delta, inserted
+
+
+# Return the runs of a delta, as by matchRuns().
+def deltaRuns(delta):
+    runs = []
+    position = 0
+    for item in delta:
+        if isinstance(item, list):
+            runs.append([item[0], position, item[1] - item[0]])
+            position += item[1] - item[0]
+        else:
+            runs.append([None, position, len(item)])
+            position += len(item)
+    return runs
+
+
+# Return a Boolean that indicates whether a section's stored notes equal
+# notes. The stored notes are read chunk by chunk, only as far as they match.
+def storedNotesEqual(session, section, notes):
+    if section.notes_size != len(notes):
+        return False
+    position = 0
+    for part in iterNotes(session, section.id):
+        if notes[position:position + len(part)] != part:
+            return False
+        position += len(part)
+    return True
+
+
+# Append a revision to a section's log, given the title and notes it is about
+# to be assigned, notes being None if they remain the stored ones. Then, the
+# notes are not read, but copied by the delta or the snapshot chunk by chunk.
+# If the section has no revisions yet, e.g. it predates the log, its current
+# state is first recorded as revision 1. This must be called before the
+# section's title and notes are changed, and in the same session transaction.
+# A new section's revision is recorded after its notes are written.
+def recordRevision(session, section, title, notes=None):
+    if notes is not None and notes.isspace():
+        notes = ''  # As stored by writeNotes.
+    last = session.query(Revision).filter_by(section_id=section.id).\
+        order_by(Revision.number.desc()).first()
+    if last is None:
+        if section.title == title and \
+                (notes is None or storedNotesEqual(session, section, notes)):
+            snapshotRevision(
+                session, section, 1, title, iterNotes(session, section.id),
+                section.notes_size)
+            return
+        last = snapshotRevision(
+            session, section, 1, section.title,
+            iterNotes(session, section.id), section.notes_size,
+            section.utce or section.utci)
+    number = last.number + 1
+    if notes is None:
+        # The section's stored notes are those of the latest revision.
+        if number - last.base_number >= snapshotInterval():
+            snapshotRevision(
+                session, section, number, title,
+                iterNotes(session, section.id), section.notes_size)
+            return
+        delta = [[0, section.notes_size]] if section.notes_size else []
+    else:
+        if number - last.base_number >= snapshotInterval():
+            snapshotRevision(
+                session, section, number, title, [notes], len(notes))
+            return
+        delta, inserted = notesDelta(iterNotes(session, section.id), notes)
+        if 2 * inserted > len(notes):
+            snapshotRevision(
+                session, section, number, title, [notes], len(notes))
+            return
+    session.add(Revision(
+        section_id=section.id, number=number, base_number=last.base_number,
+        snapshot=False, title=title,
+        data=compress(dumps(delta, separators=(',', ':')).encode()),
+        size=section.notes_size if notes is None else len(notes),
+        utc=datetime.utcnow(), editor_id=section.editor_id))
+
+
+# Add a snapshot revision of a section to the session and return it, given
+# its notes as an iterable of string parts and their size in characters. The
+# revision is flushed, then its notes are stored in chunks as the parts come.
+def snapshotRevision(session, section, number, title, parts, size, utc=None):
+    revision = Revision(
+        section_id=section.id, number=number, base_number=number,
+        snapshot=True, title=title, size=size, utc=utc or datetime.utcnow(),
+        editor_id=section.editor_id)
+    session.add(revision)
+    session.flush()
+    session.add_all(
+        iterChunkRows(RevisionChunk, {'revision_id': revision.id}, parts))
+    return revision
+
+
+# Return the revisions of a section, latest first, without their data.
+def sectionRevisions(session, section_id):
+    return session.query(Revision).options(defer(Revision.data)).\
+        filter_by(section_id=section_id).\
+        order_by(Revision.number.desc()).all()
+
+
+# Reader of ranges of the notes of a chain of revisions of a section, from the
+# snapshot of base_number up to the revision of number. The chain's deltas are
+# fetched in one query. Snapshot chunks are fetched a few at a time, as reads
+# reach them, and the last fetched are kept for the next reads.
+class RevisionReader:
+    def __init__(self, session, section_id, base_number, number):
+        self.session = session
+        self.base_number = base_number
+        self.deltas = {}
+        self.starts = {}
+        self.chunks = {}
+        chain = session.query(
+            Revision.id, Revision.number, Revision.snapshot, Revision.data).\
+            filter(Revision.section_id == section_id,
+                   Revision.number >= base_number,
+                   Revision.number <= number).\
+            order_by(Revision.number)
+        for link in chain:
+            if link.snapshot:
+                self.snapshot_id = link.id
+                continue
+            delta = loads(decompress(link.data).decode())
+            self.deltas[link.number] = delta
+            # The new character at which each item of the delta starts
+            self.starts[link.number] = [run[1] for run in deltaRuns(delta)]
+
+    # Return the text of a chunk of the snapshot by its number.
+    def snapshotChunk(self, number):
+        if number not in self.chunks:
+            chunks = self.session.query(
+                RevisionChunk.number, RevisionChunk.data).\
+                filter(RevisionChunk.revision_id == self.snapshot_id,
+                       RevisionChunk.number >= number).\
+                order_by(RevisionChunk.number).limit(chunksPerFetch()).all()
+            self.chunks = {chunk.number: decompress(chunk.data).decode()
+                           for chunk in chunks}
+        return self.chunks.get(number, '')
+
+    # Yield the notes of the revision of a number in the chain from character
+    # start up to character stop, part by part.
+    def iterRange(self, number, start, stop):
+        if start >= stop:
+            return
+        if number == self.base_number:
+            size = noteChunkSize()
+            for chunkNumber in range(start // size, (stop - 1) // size + 1):
+                offset = chunkNumber * size
+                yield self.snapshotChunk(chunkNumber)[
+                    max(start - offset, 0):stop - offset]
+            return
+        delta = self.deltas[number]
+        starts = self.starts[number]
+        index = max(bisect_right(starts, start) - 1, 0)
+        while index < len(delta) and starts[index] < stop:
+            item = delta[index]
+            offset = starts[index]
+            if isinstance(item, list):
+                yield from self.iterRange(
+                    number - 1, item[0] + max(start - offset, 0),
+                    min(item[0] + stop - offset, item[1]))
+            else:
+                yield item[max(start - offset, 0):stop - offset]
+            index += 1
+
+    # Return the notes of the revision of a number in the chain from character
+    # start up to character stop.
+    def read(self, number, start, stop):
+        return ''.join(self.iterRange(number, start, stop))
+
+    # Yield the notes of the revision of a number in the chain, of size
+    # characters, chunk by chunk.
+    def iterParts(self, number, size):
+        for start in range(0, size, noteChunkSize()):
+            yield self.read(number, start, start + noteChunkSize())
+
+
+# Return a revision of a section and its reconstructed notes from character
+# start up to character stop, or to the end if stop is None. Only the range is
+# reconstructed.
+def revisionNotes(session, section_id, number, start=0, stop=None):
+    revision = session.query(Revision).options(defer(Revision.data)).\
+        filter_by(section_id=section_id, number=number).one()
+    stop = revision.size if stop is None else min(stop, revision.size)
+    reader = RevisionReader(
+        session, section_id, revision.base_number, number)
+    return revision, reader.read(number, start, stop)
+
+
+# Return the diff of a revision of a section against its previous revision as
+# a triple: (revision, previous, diff). previous is None for revision 1. diff
+# is as returned by condensedDiff(). A delta revision is diffed by its delta,
+# a snapshot by runs matched against the previous notes as both are read
+# chunk by chunk. Only the notes shown are reconstructed whole.
+def revisionDiff(session, section_id, number):
+    revision = session.query(Revision).options(defer(Revision.data)).\
+        filter_by(section_id=section_id, number=number).one()
+    reader = RevisionReader(
+        session, section_id, revision.base_number, number)
+    previous = None
+    previousReader = reader
+    if number > 1:
+        previous = session.query(Revision).options(defer(Revision.data)).\
+            filter_by(section_id=section_id, number=number - 1).one()
+        if revision.snapshot:
+            previousReader = RevisionReader(
+                session, section_id, previous.base_number, number - 1)
+    if not revision.snapshot:
+        runs = deltaRuns(reader.deltas[number])
+    elif previous is None:
+        runs = [[None, 0, revision.size]]
+    else:
+        runs = matchRuns(previousReader.iterParts(number - 1, previous.size),
+                         reader.iterParts(number, revision.size))
+    diff = runsDiff(runs, previous.size if previous is not None else 0)
+    return revision, previous, condensedDiff(
+        diff, lambda start, stop: previousReader.read(number - 1, start, stop),
+        lambda start, stop: reader.read(number, start, stop))
+
+
+# Return the diff of old notes of oldSize characters and new notes, given the
+# runs of the new notes as by matchRuns(), as a list of triples: [(tag, start,
+# stop), ..., (...)], where tag is 'equal', 'delete' or 'insert'. Ranges of
+# equal and deleted notes are of the old notes, those of inserted notes of the
+# new notes. Old notes that no run copies are deleted. Runs shorter than
+# minCopySize(), or copied from before where the previous copy ended, i.e.
+# moved, are inserted.
+def runsDiff(runs, oldSize):
+    diff = []
+    position = 0
+    for start, newStart, size in runs:
+        if start is None or size < minCopySize() or start < position:
+            diff.append(('insert', newStart, newStart + size))
+        else:
+            diff.append(('delete', position, start))
+            diff.append(('equal', start, start + size))
+            position = start + size
+    diff.append(('delete', position, oldSize))
+    return diff
+
+
+# Return a diff, as by runsDiff(), condensed for display as a double: (diff,
+# truncated), given functions that return the old and the new notes from
+# character start up to character stop. Each run of changes of at most
+# maxWordDiffSize() characters is diffed word by word. Unchanged notes are
+# shown within diffContextSize() characters of a change, the rest is given as
+# ('skip', number of characters). Changes beyond maxDiffSize() characters are
+# left out, and truncated is True. Only the notes shown are read.
+def condensedDiff(diff, oldNotes, newNotes):
+    runs = []
+    for tag, start, stop in diff:
+        if start == stop:
+            continue
+        if tag == 'equal':
+            if runs and runs[-1][0] == 'equal' and runs[-1][2] == start:
+                runs[-1][2] = stop
+            else:
+                runs.append(['equal', start, stop])
+        else:
+            if not runs or runs[-1][0] != 'change':
+                runs.append(['change', [], []])
+            runs[-1][1 if tag == 'delete' else 2].append((start, stop))
+    condensed = []
+    shown = 0
+    context = diffContextSize()
+    for index, run in enumerate(runs):
+        if run[0] == 'equal':
+            start, stop = run[1], run[2]
+            head = context if index > 0 else 0
+            tail = context if index < len(runs) - 1 else 0
+            if stop - start <= head + tail:
+                condensed.append(('equal', oldNotes(start, stop)))
+                continue
+            if head:
+                condensed.append(('equal', oldNotes(start, start + head)))
+            condensed.append(('skip', stop - start - head - tail))
+            if tail:
+                condensed.append(('equal', oldNotes(stop - tail, stop)))
+            continue
+        shown += sum(stop - start for start, stop in run[1] + run[2])
+        if shown > maxDiffSize():
+            return condensed, True
+        deleted = ''.join(oldNotes(start, stop) for start, stop in run[1])
+        inserted = ''.join(newNotes(start, stop) for start, stop in run[2])
+        if deleted and inserted and \
+                len(deleted) + len(inserted) <= maxWordDiffSize():
+            condensed.extend(wordDiff(deleted, inserted))
+        else:
+            condensed.extend((tag, text) for tag, text in
+                             [('delete', deleted), ('insert', inserted)]
+                             if text)
+    return condensed, False
+
+
+# Return the word diff of old and new notes as a list of doubles:
+# [(tag, text), ..., (...)], where tag is 'equal', 'delete' or 'insert'. Its
+# time grows with the product of the numbers of words, thus, it is only
+# employed for short changes.
+def wordDiff(old, new):
+    oldWords = split(r'(\s+)', old)
+    newWords = split(r'(\s+)', new)
+    diff = []
+    matcher = SequenceMatcher(None, oldWords, newWords, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            diff.append(('equal', ''.join(oldWords[i1:i2])))
+        else:
+            if i1 < i2:
+                diff.append(('delete', ''.join(oldWords[i1:i2])))
+            if j1 < j2:
+                diff.append(('insert', ''.join(newWords[j1:j2])))
+    return diff
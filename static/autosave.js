@@ -0,0 +1,34 @@
+/*
+Autosave of section form drafts
+  A form with a data-draft-url attribute posts its fields to that URL once
+typing pauses for 2 seconds. The app buffers these drafts and writes them to
+the database in periodic batches. The form's hidden 'opened' field carries the
+time the form was opened, so that the app can refuse autosaves that arrive
+after the form was submitted. */
+
+(function () {
+  var pause = 2000; // milliseconds
+
+  document.querySelectorAll('form[data-draft-url]').forEach(function (form) {
+    var timer = null;
+    var submitted = false;
+
+    form.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        if (!submitted) {
+          fetch(form.dataset.draftUrl, {
+            method: 'POST',
+            body: new FormData(form),
+            credentials: 'same-origin'
+          });
+        }
+      }, pause);
+    });
+
+    form.addEventListener('submit', function () {
+      submitted = true;
+      clearTimeout(timer);
+    });
+  });
+})();
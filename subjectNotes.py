@@ -1,18 +1,34 @@
 from os import environ, urandom
 from datetime import datetime
+from functools import wraps
 from hashlib import sha256
-from requests import post
+from requests import get, post
 from flask import Flask, render_template, url_for
-from flask import request, redirect, flash, jsonify
-from flask import session as signed_session
+from flask import request, redirect, flash, jsonify, send_file, abort
+from flask import stream_with_context, get_flashed_messages
+from flask import session as signed_session, g
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import NoResultFound
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
+from msgpack import packb
 from database_setup import Base, Topic, Editor, Section
-from database_setup import subject, maxSectionsPerTopic
+from revisions import recordRevision, sectionRevisions, revisionNotes
+from revisions import revisionDiff
+from database_setup import subject, maxSectionsPerTopic, sectionSerialKeys
 from gapi_consts import gaj, gajFileName, gapiOauth, gapiScopes
+from gapi_consts import gapiStubURL, gapiUserinfoURI, gapiRevokeURI
+from prerender import prerenderEVName, prerenderDir, existingPagePath, pageLock
+from prerender import writePage, removePage
+from profiler import profileHeaderName, profileRequested
+from profiler import startProfile, finishProfile
+from queries import allTopics, latestSections, topicById, topicSections
+from queries import sectionById, editorEmail
+from queries import sectionColumnsByIds, topicSectionColumns
+from note_chunks import writeNotes, iterNotes, readNotesByIds
+from drafts import DraftBuffer, draftTimeFormat
 
 app = Flask(__name__)
 
@@ -35,10 +51,17 @@ else:
     # FLASK_ENV, 'production'.
     engine = create_engine(environ.get('DATABASE_URL'))
 
+if gapiStubURL() is not None:
+    # A stand-in OAuth 2 provider is served locally over HTTP for testing.
+    environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+
 Base.metadata.bind = engine
 
 DBSession = sessionmaker(bind=engine)  # Define a configured session class.
 
+# Buffer of autosaved drafts of the section forms. See drafts.py.
+draftBuffer = DraftBuffer(DBSession)
+
 
 # Place relevant Google API project credentials in Python dictionary.
 def credentials_to_dict(credentials):
@@ -50,6 +73,16 @@ def credentials_to_dict(credentials):
             'scopes': credentials.scopes}
 
 
+# Initialize flow instance for managing the OAuth 2 protocol flow with the
+# provider described by the GAJ.
+def gapiFlow(**kwargs):
+    if gapiStubURL() is not None:
+        # The stand-in provider has no GAJ file.
+        return Flow.from_client_config(gaj(), scopes=gapiScopes(), **kwargs)
+    return Flow.from_client_secrets_file(
+        gajFileName(), scopes=gapiScopes(), **kwargs)
+
+
 # Return a Boolean that indicates whether user is signed or not.
 def signedIn():
     # Since 'userinfo' depends on 'credentials', only a check for 'credentials'
@@ -73,6 +106,111 @@ def gagn():
         return None
 
 
+# Max number of sections a multi-get JSON API request can retrieve
+def maxSectionsPerRequest():
+    return 50
+
+
+# Media types of the JSON API endpoints, in order of preference
+def apiMediaTypes():
+    return ['application/json', 'application/msgpack',
+            'application/x-msgpack']
+
+
+# Return the response of a JSON API endpoint in the media type that best
+# matches the request's Accept header, JSON or MessagePack. Since the body
+# varies by that header, the response says so to caches.
+def apiResponse(data):
+    mediaType = request.accept_mimetypes.best_match(apiMediaTypes())
+    if mediaType in apiMediaTypes()[1:]:
+        response = app.response_class(packb(data, use_bin_type=True),
+                                      mimetype=mediaType)
+    else:
+        response = jsonify(data)
+    response.vary.add('Accept')
+    return response
+
+
+# Max number of characters of notes a JSON API request retrieves per section
+def notesPageSize():
+    return 16384
+
+
+# Return the Section fields named by the request's 'fields' argument, a comma
+# separated list of names from sectionSerialKeys(), e.g. 'title,notes'. The id
+# field is always included. Without the argument, every field is returned. An
+# unknown name aborts the request.
+def requestedSectionFields():
+    names = request.args.get('fields')
+    if names is None:
+        return list(sectionSerialKeys())
+    names = set(names.split(',')) | {'id'}
+    if not names <= set(sectionSerialKeys()):
+        abort(400)
+    return [name for name in sectionSerialKeys() if name in names]
+
+
+# Return the Section columns of fields. Notes are not a column.
+def sectionColumns(fields):
+    return [getattr(Section, name) for name in fields if name != 'notes']
+
+
+# Return the range of notes requested by the request's 'offset' and 'length'
+# arguments, in characters, as a double: (start, stop). The length defaults to,
+# and is at most, notesPageSize(). Invalid arguments abort the request.
+def requestedNotesRange():
+    try:
+        start = int(request.args.get('offset', 0))
+        length = int(request.args.get('length', notesPageSize()))
+    except ValueError:
+        abort(400)
+    if start < 0 or length < 0:
+        abort(400)
+    return start, start + min(length, notesPageSize())
+
+
+# Return the notes of sections in the given range by section id, if fields
+# include notes. They are read in one query. See note_chunks.py.
+def sectionsNotes(session, section_ids, fields, notesRange):
+    if 'notes' not in fields:
+        return {}
+    return readNotesByIds(session, section_ids, *notesRange)
+
+
+# Return a section, or a row of Section columns, serialized with the given
+# fields. Its notes are taken from notesById, as returned by sectionsNotes().
+def serializeSection(section, fields, notesById):
+    sectionDict = {}
+    for name in fields:
+        if name == 'notes':
+            value = notesById.get(section.id, '')
+        else:
+            value = getattr(section, name)
+        sectionDict[sectionSerialKeys()[name]] = value
+    return sectionDict
+
+
+# Yield the notes of a section chunk by chunk, from a session of its own. A
+# view that streams them holds one chunk in memory at a time.
+def streamedNotes(section_id):
+    session = DBSession()
+    try:
+        yield from iterNotes(session, section_id)
+    finally:
+        session.close()
+
+
+# Render a template as a streamed response, so that notes it iterates are
+# sent as they are read.
+def streamTemplate(templateName, **context):
+    # Pop flashed messages now, while the session can still be saved. They
+    # remain available to the template for this request.
+    get_flashed_messages()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(templateName)
+    return app.response_class(stream_with_context(template.generate(context)))
+
+
 # Check whether referrer is a GAPI OAuth2 URL (gou).
 # This is a custom Jinja2 template test.
 @app.template_test("gou")
@@ -82,7 +220,135 @@ def is_gou(referrer):
     return False
 
 
+# Profile a request if it is asked for by its profile header or selected at
+# random. See profiler.py.
+@app.before_request
+def beginRequestProfile():
+    if profileRequested(request.headers.get(profileHeaderName())):
+        g.profile = startProfile(request.endpoint or 'unrouted')
+
+
+@app.teardown_request
+def endRequestProfile(exception):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        finishProfile(profile)
+
+
+# Decorator for public views that may be served pre-rendered
+#   A visitor is served the view's pre-rendered page, if it exists. If it does
+# not, the page is rendered live and, once the response is sent, regenerated
+# for later visitors. A visitor with pending flash messages gets a live render,
+# since those messages are not part of a pre-rendered page. Contributors
+# always get live renders.
+def prerendered(view):
+    @wraps(view)
+    def servePrerendered(*args, **kwargs):
+        if prerenderDir() is None or signedIn() or \
+                '_flashes' in signed_session:
+            return view(*args, **kwargs)
+        path = existingPagePath(request.path)
+        if path is not None:
+            return send_file(path, conditional=True)
+        page = app.make_response(view(*args, **kwargs))
+        if page.status_code == 200:
+            # The live render is not written, since it may predate a change
+            # committed by another process while it was rendered.
+            endpoint, values = request.endpoint, request.view_args
+            page.call_on_close(
+                lambda: prerenderMissingPage(endpoint, **values))
+        return page
+    return servePrerendered
+
+
+# Render a public view as a visitor sees it and write its page.
+#   The view is run in a request context without a session cookie, thus, as a
+# visitor. If the view does not render a page, e.g. it redirects, any page
+# previously written for it is removed. The caller must hold pageLock().
+def prerenderPage(endpoint, **values):
+    with app.test_request_context():
+        urlPath = url_for(endpoint, **values)
+    with app.test_request_context(urlPath):
+        page = app.view_functions[endpoint].__wrapped__(**values)
+        if isinstance(page, str):
+            writePage(urlPath, [page])
+        elif page.status_code == 200 and page.is_streamed:
+            writePage(urlPath, page.response)
+        else:
+            removePage(urlPath)
+
+
+# Render the page of a public view that a visitor missed, unless another
+# regeneration wrote it meanwhile.
+def prerenderMissingPage(endpoint, **values):
+    with app.test_request_context():
+        urlPath = url_for(endpoint, **values)
+    with pageLock(engine):
+        if existingPagePath(urlPath) is None:
+            prerenderPage(endpoint, **values)
+
+
+# Regenerate the pre-rendered pages affected by a change of a topic's section
+# list or of a section title. Those are the contents, the topic contents and
+# every section view of the topic, since each lists the topic's sections.
+# Pages of section ids no longer in use, e.g. after a deletion, are removed.
+def prerenderTopic(topic_id):
+    if prerenderDir() is None:
+        return
+    with pageLock(engine):
+        session = DBSession()
+        section_ids = [row.id for row in session.query(Section.id).
+                       filter_by(topic_id=topic_id).order_by(Section.id)]
+        session.close()
+        prerenderPage('contents')
+        prerenderPage('topicContents', topic_id=topic_id)
+        for section_id in range(section_ids[0],
+                                section_ids[0] + maxSectionsPerTopic()):
+            if section_id in section_ids:
+                prerenderPage(
+                    'viewSection', topic_id=topic_id, section_id=section_id)
+            else:
+                with app.test_request_context():
+                    removePage(url_for('viewSection', topic_id=topic_id,
+                                       section_id=section_id))
+
+
+# Regenerate the pre-rendered pages affected by a change of a section's notes.
+# Those are the contents, which lists the latest edited sections, and the
+# section's own view. A topic's first section is viewed in the topic contents.
+def prerenderSection(topic_id, section_id):
+    if prerenderDir() is None:
+        return
+    with pageLock(engine):
+        prerenderPage('contents')
+        if section_id % maxSectionsPerTopic() == 0:
+            prerenderPage('topicContents', topic_id=topic_id)
+        else:
+            prerenderPage(
+                'viewSection', topic_id=topic_id, section_id=section_id)
+
+
+# Command for pre-rendering every public view but about, which depends on the
+# referrer of its request
+#   Run it by: FLASK_APP=subjectNotes flask prerender
+@app.cli.command('prerender')
+def prerenderAll():
+    if prerenderDir() is None:
+        print('Set {} to pre-render the public views.'.
+              format(prerenderEVName()))
+        return
+    with app.test_request_context():
+        # Remove any about page written by earlier versions.
+        removePage(url_for('about'))
+    session = DBSession()
+    topic_ids = [row.id for row in session.query(Topic.id)]
+    session.close()
+    for topic_id in topic_ids:
+        prerenderTopic(topic_id)
+
+
 # Route for about
+#   It is not pre-rendered, since its header depends on the request's referrer.
 @app.route('/about')
 def about():
     return render_template(
@@ -112,7 +378,7 @@ def signInDesk():
 @app.route('/authenticate')
 def authenticate():
     # Initialize flow instance for managing the protocol flow.
-    flow = Flow.from_client_secrets_file(gajFileName(), scopes=gapiScopes())
+    flow = gapiFlow()
 
     # Set redirect URI to that set in the Google API Console.
     if environ.get('DATABASE_URL') is None:
@@ -140,8 +406,7 @@ def authenticate():
 def oauth2callback():
     if request.args.get('code'):
         # Re-initialize flow instance with verification of session state.
-        flow = Flow.from_client_secrets_file(
-            gajFileName(), scopes=gapiScopes(), state=signed_session['state'])
+        flow = gapiFlow(state=signed_session['state'])
 
         # This is part of the re-initialization, by API design.
         if environ.get('DATABASE_URL') is None:
@@ -158,13 +423,19 @@ def oauth2callback():
         #       database.
         signed_session['credentials'] = credentials_to_dict(flow.credentials)
 
-        oauth2 = build(gapiOauth()['name'], gapiOauth()['version'],
-                       credentials=flow.credentials)
-
         # Store userinfo in session.
         # TODO: For production, store userinfo encrypted in a persistent
         #       database.
-        signed_session['userinfo'] = oauth2.userinfo().get().execute()
+        if gapiStubURL() is not None:
+            # The stand-in provider has no API discovery document.
+            signed_session['userinfo'] = get(
+                gapiUserinfoURI(), headers={
+                    'Authorization': 'Bearer ' + flow.credentials.token}
+            ).json()
+        else:
+            oauth2 = build(gapiOauth()['name'], gapiOauth()['version'],
+                           credentials=flow.credentials)
+            signed_session['userinfo'] = oauth2.userinfo().get().execute()
 
         flash('Sign in approved. Welcome {}.'.
               format(signed_session['userinfo']['given_name']))
@@ -181,7 +452,7 @@ def signOut():
 
         # Revoke credentials
         revoke = post(
-            'https://accounts.google.com/o/oauth2/revoke',
+            gapiRevokeURI(),
             params={'token': credentials.token},
             headers={'content-type': 'application/x-www-form-urlencoded'})
 
@@ -215,14 +486,13 @@ def root():
 
 # Route for viewing the subject's contents in terms of topics
 @app.route('/topics')
+@prerendered
 def contents():
     session = DBSession()  # open session
-    topics = session.query(Topic).all()
+    topics = allTopics(session)
     # latest_sections is an array of doubles: [(section, t.title), ..., (...)].
     # Each double is a section and its associated topic title.
-    latest_sections = session.query(Section, Topic.title).\
-        filter(Section.topic_id == Topic.id).\
-        order_by(Section.utce.desc())[0:5]
+    latest_sections = latestSections(session)
     session.close()
     return render_template(
         'contents.html', subject=subject(), signedIn=signedIn(), uname=gagn(),
@@ -231,18 +501,18 @@ def contents():
 
 # Route for viewing a topic's contents in terms of sections
 @app.route('/topics/<int:topic_id>')
+@prerendered
 def topicContents(topic_id):
     session = DBSession()  # open session
-    topic = session.query(Topic).filter_by(id=topic_id).one()
-    sections = session.query(Section).\
-        filter_by(topic_id=topic.id).order_by(Section.id).all()
-    secEdEmail = session.query(Editor.email).\
-        filter_by(id=sections[0].editor_id).one().email
+    topic = topicById(session, topic_id)
+    sections = topicSections(session, topic.id)
+    secEdEmail = editorEmail(session, sections[0].editor_id)
     session.close()
     userIsSecEditor = gaem() == secEdEmail
-    return render_template(
+    return streamTemplate(
         'topicContents.html', subject=subject(), topic=topic,
-        sections=sections, maxNumSecs=maxSectionsPerTopic(),
+        sections=sections, notes=streamedNotes(sections[0].id),
+        maxNumSecs=maxSectionsPerTopic(),
         secEdEmail=secEdEmail, signedIn=signedIn(), uname=gagn(),
         userIsSecEditor=userIsSecEditor)
 
@@ -276,15 +546,21 @@ def newSection(topic_id):
             editor_id = session.query(Editor).count()
             flash("{} is now an editor of the app.".format(gagn()))
         new_section = Section(
-            title=request.form['title'], notes=request.form['notes'],
-            topic_id=topic_id, editor_id=editor_id, id=lastTopicSec_id+1)
+            title=request.form['title'], topic_id=topic_id,
+            editor_id=editor_id, id=lastTopicSec_id+1)
         session.add(new_section)
+        session.flush()
+        writeNotes(session, new_section, request.form['notes'])
+        recordRevision(
+            session, new_section, new_section.title, request.form['notes'])
         session.commit()
+        draftBuffer.discard((gaem(), topic_id, None))
         flash('Section "{}" was added to topic "{}" by {}.'
               .format(new_section.title, topic.title, gagn()))
         if (new_section.id + 1) % maxSectionsPerTopic() == 0:
             flash('Number of sections of topic is now at maximum.')
         session.close()
+        prerenderTopic(topic_id)
         return redirect(url_for(
             'viewSection', topic_id=topic_id, section_id=new_section.id))
     else:
@@ -296,21 +572,62 @@ def newSection(topic_id):
             return redirect(url_for('topicContents', topic_id=topic_id))
         else:
             topic = session.query(Topic).filter_by(id=topic_id).one()
+            draft = draftBuffer.get(session, (gaem(), topic_id, None))
             session.close()
             return render_template('newSection.html', subject=subject(),
-                                   uname=gagn(), topic=topic)
+                                   uname=gagn(), topic=topic, draft=draft,
+                                   opened=formOpened())
+
+
+# Return the current time in the format carried by autosaves, to be stored in
+# a section form when it is opened.
+def formOpened():
+    return datetime.utcnow().strftime(draftTimeFormat())
+
+
+# Return the time the form of an autosave was opened. A missing or malformed
+# time aborts the request.
+def draftOpened():
+    try:
+        return datetime.strptime(request.form.get('opened', ''),
+                                 draftTimeFormat())
+    except ValueError:
+        abort(400)
+
+
+# Route for autosaving a draft of a new topic section
+#   Drafts are buffered and written to the database in periodic batches. See
+# drafts.py.
+@app.route('/topics/<int:topic_id>/new/draft', methods=['POST'])
+def newSectionDraft(topic_id):
+    if 'credentials' not in signed_session:
+        return '', 401
+    draftBuffer.save((gaem(), topic_id, None),
+                     request.form.get('title', '')[:50],
+                     request.form.get('notes'), draftOpened())
+    return '', 204
+
+
+# Route for autosaving a draft of an edit of a topic section
+@app.route('/topics/<int:topic_id>/<int:section_id>/draft', methods=['POST'])
+def sectionDraft(topic_id, section_id):
+    if 'credentials' not in signed_session:
+        return '', 401
+    draftBuffer.save((gaem(), topic_id, section_id),
+                     request.form.get('title', '')[:50],
+                     request.form.get('notes'), draftOpened())
+    return '', 204
 
 
 # Route for viewing a topic section
 @app.route('/topics/<int:topic_id>/<int:section_id>')
+@prerendered
 def viewSection(topic_id, section_id):
     session = DBSession()  # open session
-    topic = session.query(Topic).filter_by(id=topic_id).one()
-    sections = session.query(Section).filter_by(topic_id=topic.id).\
-        order_by(Section.id).all()
-    section = session.query(Section).filter_by(id=section_id).one()
-    secEdEmail = session.query(Editor.email).\
-        filter_by(id=section.editor_id).one().email
+    topic = topicById(session, topic_id)
+    sections = topicSections(session, topic.id)
+    section = sectionById(session, section_id)
+    secEdEmail = editorEmail(session, section.editor_id)
     session.close()
     userIsSecEditor = gaem() == secEdEmail
     if section.id == sections[0].id:
@@ -318,10 +635,10 @@ def viewSection(topic_id, section_id):
         # view via url. Then, render the associated topic contents view.
         return redirect(url_for('topicContents', topic_id=topic_id))
     else:
-        return render_template(
+        return streamTemplate(
             'viewSection.html', subject=subject(), topic=topic,
             sections=sections, section=section,
-            maxNumSecs=maxSectionsPerTopic(),
+            notes=streamedNotes(section.id), maxNumSecs=maxSectionsPerTopic(),
             secEdEmail=secEdEmail, signedIn=signedIn(), uname=gagn(),
             userIsSecEditor=userIsSecEditor)
 
@@ -342,14 +659,18 @@ def editTopicSection0(topic_id, section_id):
         topic = session.query(Topic).filter_by(id=topic_id).one()
         section = session.query(Section).filter_by(id=section_id).one()
         if request.form['notes'] != "":
-            section.notes = request.form['notes']
+            recordRevision(
+                session, section, section.title, request.form['notes'])
+            writeNotes(session, section, request.form['notes'])
             section.utce = datetime.utcnow()
             session.commit()
             flash('{} section of topic "{}" was updated by {}.'
                   .format(section.title, topic.title, gagn()))
+            prerenderSection(topic_id, section_id)
         else:
             flash('There were no changes.')
         session.close()
+        draftBuffer.discard((gaem(), topic_id, section_id))
         return redirect(url_for('viewSection', topic_id=topic_id,
                                 section_id=section_id))
     else:
@@ -368,6 +689,7 @@ def editTopicSection0(topic_id, section_id):
                 filter_by(email=edEmail).one().id
             # This user is, thus, a candidate editor of this section.
             candidate = True
+        draft = draftBuffer.get(session, (edEmail, topic_id, section_id))
         session.close()
         if not candidate or editor_id != section.editor_id:
             # Session user is not this section's editor.
@@ -378,8 +700,10 @@ def editTopicSection0(topic_id, section_id):
                 flash('Contact {} to suggest that edit.'.format(secEdEmail))
                 return redirect(url_for('contents'))
         # Otherwise, session user is this section's editor.
-        return render_template('editTopicSection0.html', subject=subject(),
-                               uname=gagn(), topic=topic, section=section)
+        return streamTemplate('editTopicSection0.html', subject=subject(),
+                              uname=gagn(), topic=topic, section=section,
+                              notes=streamedNotes(section.id), draft=draft,
+                              opened=formOpened())
 
 
 # Route for updating a topic section
@@ -398,17 +722,25 @@ def editSection(topic_id, section_id):
         topic = session.query(Topic).filter_by(id=topic_id).one()
         section = session.query(Section).filter_by(id=section_id).one()
         if request.form['title'] != "" or request.form['notes'] != "":
+            recordRevision(session, section,
+                           request.form['title'] or section.title,
+                           request.form['notes'] or None)
             if request.form['title'] != "":
                 section.title = request.form['title']
             if request.form['notes'] != "":
-                section.notes = request.form['notes']
+                writeNotes(session, section, request.form['notes'])
             section.utce = datetime.utcnow()
             session.commit()
             flash('Section "{}" of topic "{}" was updated by {}.'
                   .format(section.title, topic.title, gagn()))
+            if request.form['title'] != "":
+                prerenderTopic(topic_id)
+            else:
+                prerenderSection(topic_id, section_id)
         else:
             flash('There were no changes.')
         session.close()
+        draftBuffer.discard((gaem(), topic_id, section_id))
         return redirect(url_for('viewSection', topic_id=topic_id,
                                 section_id=section_id))
     else:
@@ -425,6 +757,7 @@ def editSection(topic_id, section_id):
             editor_id = session.query(Editor.id).\
                 filter_by(email=edEmail).one().id
             candidate = True
+        draft = draftBuffer.get(session, (edEmail, topic_id, section_id))
         session.close()
         if not candidate or editor_id != section.editor_id:
             if request.referrer is not None:
@@ -433,8 +766,10 @@ def editSection(topic_id, section_id):
             else:
                 flash('Contact {} to suggest that edit.'.format(secEdEmail))
                 return redirect(url_for('contents'))
-        return render_template('editSection.html', subject=subject(),
-                               uname=gagn(), topic=topic, section=section)
+        return streamTemplate('editSection.html', subject=subject(),
+                              uname=gagn(), topic=topic, section=section,
+                              notes=streamedNotes(section.id), draft=draft,
+                              opened=formOpened())
 
 
 # Route for deleting a topic section
@@ -479,7 +814,12 @@ def deleteSection(topic_id, section_id):
                     section = session.query(Section).filter_by(id=index).one()
                     section.id = index - 1
                     session.commit()
+        # Keep autosaves from forms opened before the re-sequencing from
+        # landing on the section that now has their section id.
+        draftBuffer.renumber(session, topic_id, section_id)
+        session.commit()
         session.close()
+        prerenderTopic(topic_id)
         return redirect(url_for('topicContents', topic_id=topic_id))
     else:
         session = DBSession()  # open session
@@ -505,8 +845,9 @@ def deleteSection(topic_id, section_id):
                 flash('Contact {} to suggest that deletion.'.
                       format(secEdEmail))
                 return redirect(url_for('contents'))
-        return render_template('deleteSection.html', subject=subject(),
-                               uname=gagn(), topic=topic, section=section)
+        return streamTemplate('deleteSection.html', subject=subject(),
+                              uname=gagn(), topic=topic, section=section,
+                              notes=streamedNotes(section.id))
 
 
 # Route for viewing a topic section in JSON -- Section JSON API endpoint
@@ -518,10 +859,26 @@ def sectionJSON(topic_id, section_id):
             return redirect(request.referrer)
         else:
             return redirect(url_for('contents'))
+    fields = requestedSectionFields()
+    notesRange = requestedNotesRange()
     session = DBSession()
-    section = session.query(Section).filter_by(id=section_id).one()
+    if request.args.get('fields') is None:
+        try:
+            section = sectionById(session, section_id)
+        except NoResultFound:
+            section = None
+    else:
+        # Retrieve only the requested columns.
+        rows = sectionColumnsByIds(
+            session, {section_id}, sectionColumns(fields))
+        section = rows[0] if rows else None
+    if section is None:
+        session.close()
+        abort(404)
+    sectionDict = serializeSection(section, fields, sectionsNotes(
+        session, [section.id], fields, notesRange))
     session.close()
-    return jsonify(section.serialize)
+    return apiResponse(sectionDict)
 
 
 # Route for viewing a topic's sections in JSON -- Topic JSON API endpoint
@@ -533,17 +890,143 @@ def topicJSON(topic_id):
             return redirect(request.referrer)
         else:
             return redirect(url_for('contents'))
+    fields = requestedSectionFields()
+    notesRange = requestedNotesRange()
     session = DBSession()
-    sections = session.query(Section).filter_by(topic_id=topic_id).\
-        order_by(Section.id).all()
+    if request.args.get('fields') is None:
+        sections = topicSections(session, topic_id)
+    else:
+        # Retrieve only the requested columns.
+        sections = topicSectionColumns(
+            session, topic_id, sectionColumns(fields))
+    notesById = sectionsNotes(
+        session, [section.id for section in sections], fields, notesRange)
     sectionsArrOfDicts = []
     for section in sections:
-        sectionsArrOfDicts.append(section.serialize)
-    topic = session.query(Topic).filter_by(id=topic_id).one()
+        sectionsArrOfDicts.append(
+            serializeSection(section, fields, notesById))
+    topic = topicById(session, topic_id)
     topicDict = topic.serialize
     topicDict.update({'k3 sections': sectionsArrOfDicts})
     session.close()
-    return jsonify(topicDict)
+    return apiResponse(topicDict)
+
+
+# Route for viewing several sections in JSON -- Sections JSON API endpoint
+#   The sections are given by the 'ids' argument, a comma separated list of at
+# most maxSectionsPerRequest() section ids, and are retrieved by one query. The
+# 'fields' argument limits the columns retrieved. See
+# requestedSectionFields().
+@app.route('/sections/JSON')
+def sectionsJSON():
+    if 'credentials' not in signed_session:
+        flash('Please sign in.')
+        if request.referrer is not None:
+            return redirect(request.referrer)
+        else:
+            return redirect(url_for('contents'))
+    try:
+        section_ids = {int(section_id) for section_id
+                       in request.args.get('ids', '').split(',')}
+    except ValueError:
+        abort(400)
+    if len(section_ids) > maxSectionsPerRequest():
+        abort(400)
+    fields = requestedSectionFields()
+    notesRange = requestedNotesRange()
+    session = DBSession()
+    rows = sectionColumnsByIds(session, section_ids, sectionColumns(fields))
+    notesById = sectionsNotes(
+        session, [row.id for row in rows], fields, notesRange)
+    sectionsArrOfDicts = []
+    for row in rows:
+        sectionsArrOfDicts.append(serializeSection(row, fields, notesById))
+    session.close()
+    return apiResponse({'k1 sections': sectionsArrOfDicts})
+
+
+# Route for viewing the revision history of a topic section
+@app.route('/topics/<int:topic_id>/<int:section_id>/history')
+def sectionHistory(topic_id, section_id):
+    if 'credentials' not in signed_session:
+        flash('Please sign in.')
+        if request.referrer is not None:
+            return redirect(request.referrer)
+        else:
+            return redirect(url_for('contents'))
+    session = DBSession()
+    topic = topicById(session, topic_id)
+    section = sectionById(session, section_id)
+    revisions = sectionRevisions(session, section_id)
+    edEmails = {}
+    if revisions:
+        edEmails = dict(session.query(Editor.id, Editor.email).filter(
+            Editor.id.in_({revision.editor_id for revision in revisions})))
+    session.close()
+    return render_template(
+        'sectionHistory.html', subject=subject(), uname=gagn(), topic=topic,
+        section=section, revisions=revisions, edEmails=edEmails)
+
+
+# Route for viewing a revision of a topic section, as a diff against its
+# previous revision
+@app.route('/topics/<int:topic_id>/<int:section_id>/history/<int:number>')
+def sectionRevision(topic_id, section_id, number):
+    if 'credentials' not in signed_session:
+        flash('Please sign in.')
+        if request.referrer is not None:
+            return redirect(request.referrer)
+        else:
+            return redirect(url_for('contents'))
+    session = DBSession()
+    topic = topicById(session, topic_id)
+    revision, previous, (diff, truncated) = revisionDiff(
+        session, section_id, number)
+    edEmail = editorEmail(session, revision.editor_id)
+    session.close()
+    return render_template(
+        'sectionRevision.html', subject=subject(), uname=gagn(), topic=topic,
+        section_id=section_id, revision=revision, previous=previous,
+        diff=diff, truncated=truncated, edEmail=edEmail)
+
+
+# Route for viewing the revision history of a topic section in JSON -- Section
+# History JSON API endpoint
+@app.route('/topics/<int:topic_id>/<int:section_id>/history/JSON')
+def sectionHistoryJSON(topic_id, section_id):
+    if 'credentials' not in signed_session:
+        flash('Please sign in.')
+        if request.referrer is not None:
+            return redirect(request.referrer)
+        else:
+            return redirect(url_for('contents'))
+    session = DBSession()
+    revisions = sectionRevisions(session, section_id)
+    session.close()
+    revisionsArrOfDicts = []
+    for revision in revisions:
+        revisionsArrOfDicts.append(revision.serialize)
+    return apiResponse({'k1 section id': section_id,
+                        'k2 revisions': revisionsArrOfDicts})
+
+
+# Route for viewing a revision of a topic section in JSON -- Revision JSON API
+# endpoint
+@app.route('/topics/<int:topic_id>/<int:section_id>/history/<int:number>/JSON')
+def revisionJSON(topic_id, section_id, number):
+    if 'credentials' not in signed_session:
+        flash('Please sign in.')
+        if request.referrer is not None:
+            return redirect(request.referrer)
+        else:
+            return redirect(url_for('contents'))
+    notesRange = requestedNotesRange()
+    session = DBSession()
+    revision, notes = revisionNotes(session, section_id, number, *notesRange)
+    session.close()
+    revisionDict = revision.serialize
+    revisionDict.update({'k6 notes': notes})
+    return apiResponse(revisionDict)
 
 
 if __name__ == '__main__':